@@ -0,0 +1,333 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows; a cluster there evicts without holding the directory lock
+    fcntl = None
+
+MAX_TRACKED_PLAYS = 10000  # Play counts kept for tracks that aren't cached yet
+MAX_TRACK_DURATION = 3600  # Long mixes and live streams are never cached
+STALE_DOWNLOAD = 3600  # A partial file older than this was left behind by a crashed process
+SHARED_RESCAN_INTERVAL = 30  # Seconds between directory scans for files other processes cached
+
+class AudioCache:
+    """Size-bounded directory of remuxed Opus files for frequently played tracks.
+
+    Every play is counted per video key (``metadata_cache.video_key``). Once a
+    track reaches ``min_plays`` it is copied in the background from its already
+    resolved stream URL. When the
+    directory grows past ``max_bytes`` the least recently played (``lru``) or
+    least played (``lfu``) files are evicted.
+
+    A ``shared`` directory is used by several processes at once: files another
+    process downloaded are picked up by a periodic rescan, and a track is only
+    downloaded by the process that created its partial file. ``max_bytes`` is
+    the budget of the whole directory; eviction and index writes scan and merge
+    what is on disk while holding a lock file, so processes take turns. That
+    work runs in the default executor, never on the event loop.
+    """
+
+    def __init__(self, directory, max_bytes, min_plays=3, policy='lru', downloads=1, shared=False):
+        self.directory = directory
+        self.shared = shared
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.policy = policy
+        self.semaphore = asyncio.Semaphore(downloads)
+        self.entries = {}
+        self.plays = OrderedDict()
+        self.downloads = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self._save_handle = None
+        self._scanned_at = time.monotonic()
+        self._scanning = False
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load_index()
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def path_for(self, key):
+        """Return the local file for a video key if it is cached."""
+        if not self.enabled or not key:
+            return None
+        if self.shared:
+            self._refresh()
+        if key not in self.entries:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.total_bytes -= self.entries.pop(key)['size']
+            return None
+        return path
+
+    def record_play(self, song):
+        """Count a play and start caching the track once it is popular enough."""
+        if not self.enabled or not song.key:
+            return
+        now = time.time()
+        entry = self.entries.get(song.key)
+        if entry:
+            entry['plays'] += 1
+            entry['last_played'] = now
+            self.hits += 1
+            if self.shared:
+                # The file's mtime tells the other processes it was played
+                asyncio.get_event_loop().run_in_executor(None, self._touch, self._path(song.key))
+        else:
+            plays = self.plays.pop(song.key, 0) + 1
+            self.plays[song.key] = plays
+            while len(self.plays) > MAX_TRACKED_PLAYS:
+                self.plays.popitem(last=False)
+            if (plays >= self.min_plays and song.url and song.key not in self.downloads
+                    and 0 < (song.duration or 0) <= MAX_TRACK_DURATION):
+                self.downloads[song.key] = asyncio.create_task(self._download(song.key, song.url, song.codec))
+        self._schedule_save()
+
+    def _refresh(self):
+        """Pick up files other processes cached, rescanning the directory off the event loop now and then."""
+        if self._scanning or time.monotonic() - self._scanned_at < SHARED_RESCAN_INTERVAL:
+            return
+        self._scanning = True
+        future = asyncio.get_event_loop().run_in_executor(None, self._scan, dict(self.entries))
+        future.add_done_callback(self._rescanned)
+
+    def _rescanned(self, future):
+        self._scanning = False
+        self._scanned_at = time.monotonic()
+        try:
+            entries = future.result()
+        except OSError as e:
+            logging.error(f"Failed to scan audio cache: {e}")
+            return
+        for key, entry in entries.items():
+            if key not in self.entries:
+                entry['plays'] = self.plays.pop(key, self.min_plays)
+                self.entries[key] = entry
+                self.total_bytes += entry['size']
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _claim(self, partial):
+        """Create the partial file exclusively, so only one process downloads a track."""
+        try:
+            if time.time() - os.path.getmtime(partial) > STALE_DOWNLOAD:
+                os.remove(partial)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(partial, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    async def _download(self, key, url, codec):
+        path = self._path(key)
+        partial = f"{path}.part"
+        # Another process may have cached it since the last rescan
+        if os.path.exists(path) or not self._claim(partial):
+            self.downloads.pop(key, None)
+            return
+        try:
+            async with self.semaphore:
+                # Opus streams are only remuxed; anything else is encoded once here
+                codec_args = ['-c:a', 'copy'] if codec == 'opus' else ['-c:a', 'libopus', '-b:a', '128k']
+                process = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+                    '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                    '-i', url, '-vn', '-map_metadata', '-1', *codec_args, '-f', 'opus', partial,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                try:
+                    _, stderr = await process.communicate()
+                except asyncio.CancelledError:
+                    process.kill()
+                    raise
+                if process.returncode != 0:
+                    raise Exception(stderr.decode(errors='ignore').strip() or f"exit code {process.returncode}")
+
+            os.replace(partial, path)
+            size = os.path.getsize(path)
+            self.entries[key] = {
+                'size': size,
+                'plays': self.plays.pop(key, self.min_plays),
+                'last_played': time.time(),
+            }
+            self.total_bytes += size
+            logging.info(f"Cached audio for {key} ({size // 1024} KiB)")
+            self._evict()
+            self._schedule_save()
+        except Exception as e:
+            logging.warning(f"Failed to cache audio for {key}: {e}")
+        finally:
+            self.downloads.pop(key, None)
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def _evict(self):
+        if not self.shared:
+            self._forget(self._evict_over(self.entries, self.total_bytes))
+            return
+        future = asyncio.get_event_loop().run_in_executor(None, self._evict_shared, dict(self.entries))
+        future.add_done_callback(self._evicted)
+
+    def _evict_shared(self, known):
+        # Files cached by every process count toward the budget, so go by what is on disk
+        with self._locked():
+            entries = self._scan(known)
+            return self._evict_over(entries, sum(entry['size'] for entry in entries.values()))
+
+    def _evicted(self, future):
+        try:
+            self._forget(future.result())
+        except OSError as e:
+            logging.error(f"Failed to evict from audio cache: {e}")
+
+    def _evict_over(self, entries, total):
+        """Delete files in eviction order until ``total`` fits the budget; return their keys."""
+        if self.policy == 'lfu':
+            order = lambda item: (item[1]['plays'], item[1]['last_played'])
+        else:
+            order = lambda item: item[1]['last_played']
+        evicted = []
+        for key, entry in sorted(entries.items(), key=order):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            total -= entry['size']
+            evicted.append(key)
+        return evicted
+
+    def _forget(self, keys):
+        for key in keys:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry['size']
+
+    def _scan(self, known):
+        """Return an entry for every cached file, taking play counts from ``known`` where it has them."""
+        entries = {}
+        for name in os.listdir(self.directory):
+            if not name.endswith('.opus'):
+                continue
+            path = os.path.join(self.directory, name)
+            stem = name[:-len('.opus')]
+            if '.' not in stem:
+                # Cached before ids were qualified with their extractor; it may be another site's track
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            key = stem.replace('.', ':', 1)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entry = known.get(key, {})
+            entries[key] = {
+                'size': stat.st_size,
+                'plays': entry.get('plays', self.min_plays),
+                'last_played': max(entry.get('last_played', 0), stat.st_mtime),
+            }
+        return entries
+
+    @contextmanager
+    def _locked(self):
+        """Hold the directory's lock file; closing it releases the lock."""
+        with open(os.path.join(self.directory, '.lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _path(self, key):
+        # 'Youtube:abc' is stored as 'Youtube.abc.opus'; extractor keys never contain a dot
+        return os.path.join(self.directory, f"{key.replace(':', '.', 1)}.opus")
+
+    def _index_path(self):
+        return os.path.join(self.directory, 'index.json')
+
+    def _read_index(self):
+        try:
+            with open(self._index_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load_index(self):
+        """Rebuild the index from the files on disk, keeping saved play counts."""
+        saved = self._read_index()
+        self.entries = self._scan(saved.get('entries', {}))
+        self.total_bytes = sum(entry['size'] for entry in self.entries.values())
+        self.plays.update(saved.get('plays', {}))
+        # Nothing is playing yet, so the startup eviction runs right here
+        if self.shared:
+            self._forget(self._evict_shared(self.entries))
+        else:
+            self._forget(self._evict_over(self.entries, self.total_bytes))
+
+    def _schedule_save(self):
+        # Play counts change on every track; write the index at most every few seconds
+        if self._save_handle is None:
+            self._save_handle = asyncio.get_event_loop().call_later(5, self._save)
+
+    def _save(self):
+        self._save_handle = None
+        index = {'entries': dict(self.entries), 'plays': dict(self.plays)}
+        asyncio.get_event_loop().run_in_executor(None, self._write_index, index)
+
+    def _write_index(self, index):
+        try:
+            if not self.shared:
+                self._replace_index(index)
+                return
+            with self._locked():
+                self._replace_index(self._merge_index(index))
+        except OSError as e:
+            logging.error(f"Failed to save audio cache index: {e}")
+
+    def _merge_index(self, index):
+        """Combine this process's index with the one on disk, which other processes wrote."""
+        saved = self._read_index()
+        entries = {
+            key: entry for key, entry in saved.get('entries', {}).items()
+            if os.path.exists(self._path(key))
+        }
+        for key, entry in index['entries'].items():
+            if entry['last_played'] >= entries.get(key, {}).get('last_played', 0):
+                entries[key] = entry
+        plays = saved.get('plays', {})
+        for key, count in index['plays'].items():
+            plays[key] = max(count, plays.pop(key, 0))
+        return {'entries': entries, 'plays': dict(list(plays.items())[-MAX_TRACKED_PLAYS:])}
+
+    def _replace_index(self, index):
+        partial = f"{self._index_path()}.{os.getpid()}.part"
+        with open(partial, 'w') as f:
+            json.dump(index, f)
+        os.replace(partial, self._index_path())
+
+    def cancel_all(self):
+        for task in self.downloads.values():
+            task.cancel()
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save()
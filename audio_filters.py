@@ -0,0 +1,106 @@
+import asyncio
+import json
+import logging
+
+LOUDNESS_TARGET = 'I=-16:TP=-1.5:LRA=11'
+MAX_BASS_BOOST = 20
+MIN_SPEED = 0.5
+MAX_SPEED = 2.0
+
+class AudioFilters:
+    """Per-guild audio filters, applied inside ffmpeg's filter graph."""
+
+    def __init__(self):
+        self.normalize = False
+        self.bass_boost = 0
+        self.speed = 1.0
+
+    def chain(self, volume=1.0, loudness=None):
+        """Build the ``-af`` filter chain; an empty string means the audio is left untouched.
+
+        With a cached ``loudness`` measurement normalization runs in loudnorm's
+        linear two-pass mode, otherwise it falls back to single-pass dynamic mode.
+        """
+        filters = []
+        if self.normalize:
+            if loudness:
+                filters.append(
+                    f"loudnorm={LOUDNESS_TARGET}"
+                    f":measured_I={loudness['input_i']}"
+                    f":measured_TP={loudness['input_tp']}"
+                    f":measured_LRA={loudness['input_lra']}"
+                    f":measured_thresh={loudness['input_thresh']}"
+                    f":offset={loudness['target_offset']}"
+                    f":linear=true"
+                )
+            else:
+                filters.append(f"loudnorm={LOUDNESS_TARGET}")
+        if self.bass_boost:
+            filters.append(f"bass=g={self.bass_boost}")
+        if self.speed != 1.0:
+            filters.append(f"atempo={self.speed}")
+        if volume != 1.0:
+            filters.append(f"volume={volume:.2f}")
+        return ','.join(filters)
+
+    def describe(self):
+        parts = []
+        if self.normalize:
+            parts.append("normalized")
+        if self.bass_boost:
+            parts.append(f"bass +{self.bass_boost} dB")
+        if self.speed != 1.0:
+            parts.append(f"speed {self.speed}x")
+        return ', '.join(parts) or "none"
+
+async def measure_loudness(url):
+    """Run loudnorm's analysis pass over a source and return its measurement."""
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-hide_banner', '-nostats',
+        '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+        '-i', url, '-vn',
+        '-af', f'loudnorm={LOUDNESS_TARGET}:print_format=json',
+        '-f', 'null', '-',
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        _, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        raise
+    output = stderr.decode(errors='ignore')
+    start, end = output.rfind('{'), output.rfind('}')
+    if process.returncode != 0 or start == -1 or end < start:
+        raise Exception(f"loudnorm analysis failed with exit code {process.returncode}")
+    measurement = json.loads(output[start:end + 1])
+    return {key: measurement[key] for key in (
+        'input_i', 'input_tp', 'input_lra', 'input_thresh', 'target_offset'
+    )}
+
+class LoudnessAnalyzer:
+    """Measures tracks in the background so later plays can normalize in one pass."""
+
+    def __init__(self, metadata, concurrency=1):
+        self.metadata = metadata
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pending = {}
+
+    def analyze(self, song):
+        if not song.key or not song.url or song.key in self.pending:
+            return
+        self.pending[song.key] = asyncio.create_task(self._analyze(song.key, song.url))
+
+    async def _analyze(self, video_id, url):
+        try:
+            async with self.semaphore:
+                measurement = await measure_loudness(url)
+            self.metadata.store_loudness(video_id, measurement)
+        except Exception as e:
+            logging.warning(f"Loudness analysis failed for {video_id}: {e}")
+        finally:
+            self.pending.pop(video_id, None)
+
+    def cancel_all(self):
+        for task in self.pending.values():
+            task.cancel()
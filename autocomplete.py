@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+MIN_QUERY_LENGTH = 3
+
+class SearchSuggester:
+    """Search suggestions for slash command autocomplete, answered within a time budget.
+
+    Results are cached by normalized search text. While a search runs, results
+    cached for a shorter prefix of the text are filtered down to titles that
+    still match and returned instead, so every keystroke gets an answer before
+    Discord's three second autocomplete window closes. Keystrokes are debounced
+    per user and identical searches share one extraction; a search that misses
+    the budget keeps running and fills the cache for the next keystroke.
+    """
+
+    def __init__(self, search, budget=2.5, debounce=0.3, max_entries=2000, ttl=3600):
+        self.search = search
+        self.budget = budget
+        self.debounce = debounce
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache = OrderedDict()
+        self.inflight = {}
+        self.latest = {}
+        self.hits = 0
+        self.partial = 0
+        self.timeouts = 0
+
+    async def suggest(self, user_id, text):
+        """Return ``(title, url, duration)`` tuples for what a user has typed so far."""
+        deadline = time.monotonic() + self.budget
+        text = ' '.join(text.lower().split())
+        if len(text) < MIN_QUERY_LENGTH or text.startswith(('http://', 'https://')):
+            return []
+
+        cached = self._cached(text)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        fallback = self._from_prefix(text)
+
+        # Only search for the last thing a user typed once they pause
+        self.latest[user_id] = text
+        await asyncio.sleep(self.debounce)
+        if self.latest.get(user_id) != text:
+            return fallback
+        del self.latest[user_id]
+
+        task = self.inflight.get(text)
+        if task is None:
+            task = self.inflight[text] = asyncio.create_task(self._search(text))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+        except Exception:
+            pass
+        self.partial += 1
+        return fallback
+
+    async def _search(self, text):
+        try:
+            results = await self.search(text)
+            self.cache[text] = (time.monotonic() + self.ttl, results)
+            self.cache.move_to_end(text)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+            return results
+        except Exception as e:
+            logging.warning(f"Autocomplete search for {text!r} failed: {e}")
+            raise
+        finally:
+            self.inflight.pop(text, None)
+
+    def _cached(self, text):
+        entry = self.cache.get(text)
+        if entry is None:
+            return None
+        expires_at, results = entry
+        if expires_at < time.monotonic():
+            del self.cache[text]
+            return None
+        self.cache.move_to_end(text)
+        return results
+
+    def _from_prefix(self, text):
+        """Filter the results of the longest cached prefix down to titles matching every word."""
+        words = text.split()
+        for end in range(len(text) - 1, MIN_QUERY_LENGTH - 1, -1):
+            results = self._cached(text[:end].rstrip())
+            if results is not None:
+                return [result for result in results if all(word in result[0].lower() for word in words)]
+        return []
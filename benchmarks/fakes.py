@@ -0,0 +1,280 @@
+"""Stand-ins for yt-dlp and Discord used by the offline benchmarks.
+
+Nothing here talks to the network: extraction returns canned metadata after a
+configurable delay and stream URLs point at audio files served from localhost.
+Voice clients read Opus packets from the real ffmpeg sources the bot creates,
+so encoding and process costs are measured as they are in production.
+"""
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+def video_id(n):
+    return f"bench{n:06d}"
+
+def watch_url(n):
+    return f"https://www.youtube.com/watch?v={video_id(n)}"
+
+class FakeYoutubeDL:
+    """Answers ``extract_info`` like yt-dlp, for queries understood by the benchmarks.
+
+    * ``https://www.youtube.com/watch?v=bench000042`` resolves video 42
+    * ``playlist:<first>:<count>`` lists ``count`` videos starting at ``first``
+    * anything else is a search returning one video picked from the query
+
+    The class attributes are set by the benchmark before the bot starts.
+    """
+
+    latency = 0.2  # Seconds per extraction
+    jitter = 0.1  # Extra random delay, up to this many seconds
+    flat_latency = 0.05  # Listing a playlist only costs one request
+    audio_urls = []  # Stream URLs handed out round-robin
+    duration = 5
+    codec = 'opus'
+    calls = 0
+    _lock = threading.Lock()
+
+    def __init__(self, options):
+        self.flat = bool(options.get('extract_flat'))
+
+    def extract_info(self, query, download=False):
+        with FakeYoutubeDL._lock:
+            FakeYoutubeDL.calls += 1
+        if query.startswith('playlist:'):
+            _, first, count = query.split(':')
+            time.sleep(self.flat_latency + random.random() * self.jitter)
+            return {
+                '_type': 'playlist',
+                'title': f"Benchmark playlist {first}",
+                'entries': [self._entry(n) for n in range(int(first), int(first) + int(count))],
+            }
+
+        time.sleep(self.latency + random.random() * self.jitter)
+        if query.startswith(watch_url(0)[:-len(video_id(0))]):
+            n = int(query[-6:])
+        else:
+            n = sum(map(ord, query)) % 1000000
+        info = self._video(n)
+        if query.startswith('http'):
+            return info
+        return {'_type': 'playlist', 'title': query, 'entries': [self._entry(n) if self.flat else info]}
+
+    def _entry(self, n):
+        return {
+            '_type': 'url',
+            'ie_key': 'Youtube',
+            'id': video_id(n),
+            'url': watch_url(n),
+            'title': f"Benchmark track {n}",
+            'duration': self.duration,
+        }
+
+    def _video(self, n):
+        return {
+            'id': video_id(n),
+            'extractor_key': 'Youtube',
+            'title': f"Benchmark track {n}",
+            'url': self.audio_urls[n % len(self.audio_urls)],
+            'webpage_url': watch_url(n),
+            'duration': self.duration,
+            'acodec': self.codec,
+            'abr': 96,
+        }
+
+class FakeVoiceClient:
+    """Plays a source the way discord.py's AudioPlayer does, on its own thread.
+
+    Packets are read every ``0.02 / speed`` seconds, so ``speed`` compresses
+    playback time while ffmpeg still has to produce every packet.
+    """
+
+    def __init__(self, bot, channel, speed, recorder):
+        self.bot = bot
+        self.channel = channel
+        self.guild = channel.guild
+        self.speed = speed
+        self.recorder = recorder
+        self.source = None
+        self._connected = True
+        self._thread = None
+        self._stop = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+
+    def is_connected(self):
+        return self._connected
+
+    # Like discord.py, a player that ran out counts as stopped before ``after`` is called
+    def is_playing(self):
+        return self._thread is not None and not self._stop.is_set() and self._resumed.is_set()
+
+    def is_paused(self):
+        return self._thread is not None and not self._stop.is_set() and not self._resumed.is_set()
+
+    def play(self, source, after=None):
+        if self.is_playing():
+            raise RuntimeError("Already playing audio.")
+        self.source = source
+        self._stop.clear()
+        self._resumed.set()
+        self._thread = threading.Thread(target=self._run, args=(after,), daemon=True)
+        self._thread.start()
+
+    def _run(self, after):
+        interval = 0.02 / self.speed if self.speed else 0
+        packets = 0
+        error = None
+        try:
+            while not self._stop.is_set():
+                self._resumed.wait()
+                data = self.source.read()
+                if not data:
+                    break
+                if not packets:
+                    self.recorder.first_packet(self.guild.id)
+                packets += 1
+                if interval:
+                    time.sleep(interval)
+        except Exception as e:
+            error = e
+        self._stop.set()
+        self.recorder.last_packet(self.guild.id, packets)
+        self.source.cleanup()
+        if after is not None:
+            after(error)
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    def stop(self):
+        self._stop.set()
+        self._resumed.set()
+
+    async def disconnect(self, force=False):
+        self.stop()
+        self._connected = False
+        if self in self.bot.voice_clients:
+            self.bot.voice_clients.remove(self)
+        self.guild.voice_client = None
+
+class FakeVoiceChannel:
+    def __init__(self, bot, guild, speed, recorder, connect_latency):
+        self.bot = bot
+        self.guild = guild
+        self.id = guild.id * 10 + 1
+        self.speed = speed
+        self.recorder = recorder
+        self.connect_latency = connect_latency
+        self.members = [bot.user]
+
+    async def connect(self, timeout=None, reconnect=True):
+        await asyncio.sleep(self.connect_latency)
+        voice_client = FakeVoiceClient(self.bot, self, self.speed, self.recorder)
+        self.guild.voice_client = voice_client
+        self.bot.voice_clients.append(voice_client)
+        return voice_client
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f"Benchmark guild {guild_id}"
+        self.shard_id = None
+        self.voice_client = None
+        self.members = {}
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+    def get_channel(self, channel_id):
+        return None
+
+class FakeMember:
+    def __init__(self, member_id, guild, channel):
+        self.id = member_id
+        self.display_name = f"listener{member_id}"
+        self.bot = False
+        self.guild = guild
+        self.voice = SimpleNamespace(channel=channel)
+        self.guild_permissions = SimpleNamespace(manage_guild=True, connect=True, speak=True)
+        guild.members[member_id] = self
+        channel.members.append(self)
+
+class FakeMessage:
+    def __init__(self, content=None, embed=None):
+        self.content = content
+        self.embed = embed
+
+    async def edit(self, content=None, embed=None):
+        self.content = content
+        self.embed = embed
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+    async def send_message(self, content=None, embed=None, **kwargs):
+        self.done = True
+        self.interaction.reply(content)
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, embed=None, wait=False, **kwargs):
+        self.interaction.reply(content)
+        return FakeMessage(content, embed)
+
+class FakeTextChannel:
+    async def send(self, content=None, embed=None, **kwargs):
+        return FakeMessage(content, embed)
+
+class FakeInteraction:
+    """Carries a slash command invocation and records when it was first answered."""
+
+    def __init__(self, guild, user):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = FakeTextChannel()
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.created_at = time.monotonic()
+        self.answered_at = None
+        self.replies = []
+
+    def reply(self, content):
+        if self.answered_at is None:
+            self.answered_at = time.monotonic()
+        self.replies.append(content)
+
+class FakeBot:
+    """The parts of ``commands.Bot`` the music cog uses."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.user = SimpleNamespace(id=1, display_name='bot', bot=True)
+        self.voice_clients = []
+        self.guilds = []
+        self.shard_count = None
+        self.shard_ids = None
+
+    def get_guild(self, guild_id):
+        for guild in self.guilds:
+            if guild.id == guild_id:
+                return guild
+        return None
+
+    def get_cog(self, name):
+        return None
@@ -0,0 +1,333 @@
+"""Offline load simulation of the music cog.
+
+Runs the real ``MusicBot`` cog against fake Discord objects and a fake yt-dlp,
+with stream URLs served from locally generated audio over HTTP, so ffmpeg does
+the same work it does in production. Hundreds of guilds run ``/play`` with a
+playlist concurrently; the run reports throughput, latency percentiles, memory
+per guild and ffmpeg CPU time, and can write them as JSON to compare runs.
+
+    python benchmarks/simulate.py --guilds 200 --tracks 5 --output run.json
+"""
+import argparse
+import asyncio
+import functools
+import http.server
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeBot, FakeGuild, FakeInteraction, FakeMember, FakeVoiceChannel, FakeYoutubeDL
+
+AUDIO_FILES = 4
+FREQUENCIES = (220, 330, 440, 550)
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def rank(p):
+        return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': rank(50),
+        'p90': rank(90),
+        'p99': rank(99),
+        'max': values[-1],
+    }
+
+class Recorder:
+    """Collects timings reported by the fake voice clients' player threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.play_started = {}
+        self.ended = {}
+        self.played = {}
+        self.first_audio = []
+        self.transitions = []
+        self.packets = 0
+
+    def first_packet(self, guild_id):
+        now = time.monotonic()
+        with self.lock:
+            started = self.play_started.pop(guild_id, None)
+            if started is not None:
+                self.first_audio.append(now - started)
+            ended = self.ended.pop(guild_id, None)
+            if ended is not None:
+                self.transitions.append(now - ended)
+
+    def last_packet(self, guild_id, packets):
+        with self.lock:
+            self.ended[guild_id] = time.monotonic()
+            self.played[guild_id] = self.played.get(guild_id, 0) + 1
+            self.packets += packets
+
+def generate_audio(directory, duration, codec):
+    """Write a few sine tones in the codec yt-dlp would hand out."""
+    extension, codec_args = {
+        'opus': ('webm', ['-c:a', 'libopus', '-b:a', '96k']),
+        'aac': ('m4a', ['-c:a', 'aac', '-b:a', '128k']),
+        'mp3': ('mp3', ['-c:a', 'libmp3lame', '-b:a', '128k']),
+    }[codec]
+    names = []
+    for i in range(AUDIO_FILES):
+        name = f"track{i}.{extension}"
+        subprocess.run(
+            ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-f', 'lavfi',
+             '-i', f"sine=frequency={FREQUENCIES[i]}:duration={duration}", '-vn', *codec_args,
+             os.path.join(directory, name)],
+            check=True
+        )
+        names.append(name)
+    return names
+
+def serve_directory(directory):
+    """Serve the audio over HTTP from a thread, like a stream host outside the bot's loop."""
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def queue_benchmark(bot_module, sizes=(1000, 10000), operations=5000):
+    """Time MusicQueue operations on queues of a few sizes."""
+    results = {}
+    for size in sizes:
+        queue = bot_module.MusicQueue(capacity=size * 2)
+        songs = [bot_module.Song({'id': str(i), 'title': str(i)}, None) for i in range(size)]
+        timings = {}
+
+        started = time.perf_counter()
+        queue.add_many(songs)
+        timings['add_many'] = size / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(operations):
+            queue.move(random.randrange(size), random.randrange(size))
+        timings['move'] = operations / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(operations):
+            start = random.randrange(size)
+            list(queue.slice(start, start + 10))
+        timings['page'] = operations / (time.perf_counter() - started)
+
+        removals = min(operations, size // 2)
+        started = time.perf_counter()
+        for _ in range(removals):
+            queue.remove(random.randrange(len(queue)))
+        timings['remove'] = removals / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        count = len(queue)
+        while queue.next():
+            pass
+        timings['next'] = count / (time.perf_counter() - started)
+        results[size] = {name: round(ops) for name, ops in timings.items()}
+    return results
+
+async def monitor_loop_lag(samples, interval=0.05):
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.monotonic() - started - interval))
+
+async def simulate(args, bot_module, audio_urls):
+    FakeYoutubeDL.latency = args.latency
+    FakeYoutubeDL.jitter = args.jitter
+    FakeYoutubeDL.audio_urls = audio_urls
+    FakeYoutubeDL.duration = args.duration
+    FakeYoutubeDL.codec = args.codec
+
+    recorder = Recorder()
+    fake_bot = FakeBot(asyncio.get_running_loop())
+    cog = bot_module.MusicBot(fake_bot)
+    await cog.cog_load()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    heap_before = tracemalloc.get_traced_memory()[0] if args.tracemalloc else 0
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    lag_samples = []
+    lag_task = asyncio.create_task(monitor_loop_lag(lag_samples))
+    command_latency = []
+    failed = []
+    heap_peak = 0
+    players_peak = 0
+
+    async def run_guild(index):
+        await asyncio.sleep(index * args.stagger)
+        guild = FakeGuild(10 ** 17 + index)
+        fake_bot.guilds.append(guild)
+        channel = FakeVoiceChannel(fake_bot, guild, args.speed, recorder, args.connect_latency)
+        member = FakeMember(10 ** 16 + index, guild, channel)
+        first = (index * args.tracks) % args.track_pool if args.track_pool else index * args.tracks
+
+        interaction = FakeInteraction(guild, member)
+        recorder.play_started[guild.id] = interaction.created_at
+        await cog.play.callback(cog, interaction, f"playlist:{first}:{args.tracks}")
+        if interaction.answered_at is not None:
+            command_latency.append(interaction.answered_at - interaction.created_at)
+
+        deadline = time.monotonic() + args.timeout
+        while recorder.played.get(guild.id, 0) < args.tracks:
+            if guild.voice_client is None or time.monotonic() > deadline:
+                failed.append(guild.id)
+                return
+            await asyncio.sleep(0.05)
+
+    started = time.monotonic()
+    runs = asyncio.gather(*(run_guild(index) for index in range(args.guilds)))
+    while not runs.done():
+        if args.tracemalloc:
+            heap_peak = max(heap_peak, tracemalloc.get_traced_memory()[0])
+        players_peak = max(players_peak, sum(player.estimated_size() for player in cog.players.values()))
+        await asyncio.sleep(0.5)
+    await runs
+    wall = time.monotonic() - started
+
+    lag_task.cancel()
+    # Player threads clean their sources up as they finish; give the last ones a moment
+    await asyncio.sleep(0.5)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    extractor_stats = cog.extractor.stats()
+    cache_stats = {'hits': cog.metadata.hits, 'misses': cog.metadata.misses, 'coalesced': cog.metadata.coalesced}
+    await cog.cog_unload()
+
+    tracks_played = sum(recorder.played.values())
+    ffmpeg_user = children.ru_utime - children_before.ru_utime
+    ffmpeg_system = children.ru_stime - children_before.ru_stime
+    audio_seconds = recorder.packets * 0.02
+    results = {
+        'wall_seconds': wall,
+        'guilds_failed': len(failed),
+        'tracks_played': tracks_played,
+        'tracks_per_second': tracks_played / wall,
+        'audio_seconds_per_second': audio_seconds / wall,
+        'play_command_latency': percentiles(command_latency),
+        'play_to_first_audio': percentiles(recorder.first_audio),
+        'track_transition_gap': percentiles(recorder.transitions),
+        'event_loop_lag': percentiles(lag_samples),
+        'extractions': FakeYoutubeDL.calls,
+        'extractor': extractor_stats,
+        'metadata_cache': cache_stats,
+        'memory': {
+            # ru_maxrss is in KiB on Linux
+            'rss_peak_growth_mb': (rss_peak - rss_before) / 1024,
+            'rss_per_guild_kb': (rss_peak - rss_before) / args.guilds,
+            'player_estimate_per_guild_kb': players_peak / 1024 / args.guilds,
+        },
+        'ffmpeg_cpu': {
+            'user_seconds': ffmpeg_user,
+            'system_seconds': ffmpeg_system,
+            'seconds_per_track': (ffmpeg_user + ffmpeg_system) / tracks_played if tracks_played else None,
+            'percent_of_audio_time': 100 * (ffmpeg_user + ffmpeg_system) / audio_seconds if audio_seconds else None,
+        },
+    }
+    if args.tracemalloc:
+        results['memory']['python_heap_per_guild_kb'] = (heap_peak - heap_before) / 1024 / args.guilds
+        tracemalloc.stop()
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--guilds', type=int, default=200, help="Guilds playing at once")
+    parser.add_argument('--tracks', type=int, default=5, help="Playlist length per guild")
+    parser.add_argument('--track-pool', type=int, default=0, help="Distinct tracks shared by all guilds (0: all distinct)")
+    parser.add_argument('--duration', type=int, default=5, help="Seconds of audio per track")
+    parser.add_argument('--speed', type=float, default=50, help="Playback speed-up; 0 reads packets as fast as ffmpeg makes them")
+    parser.add_argument('--codec', choices=('opus', 'aac', 'mp3'), default='opus', help="Codec of the source audio")
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds per fake extraction")
+    parser.add_argument('--jitter', type=float, default=0.1, help="Random extra extraction delay")
+    parser.add_argument('--connect-latency', type=float, default=0.05, help="Seconds to connect to voice")
+    parser.add_argument('--stagger', type=float, default=0.01, help="Seconds between guilds starting")
+    parser.add_argument('--timeout', type=float, default=300, help="Seconds a guild may take to finish")
+    parser.add_argument('--broadcast', action='store_true', help="Share one ffmpeg between guilds playing the same track")
+    parser.add_argument('--tracemalloc', action='store_true', help="Also measure Python heap per guild (slower)")
+    parser.add_argument('--skip-queue', action='store_true', help="Skip the MusicQueue micro-benchmark")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    if shutil.which('ffmpeg') is None:
+        sys.exit("ffmpeg must be on PATH to run the simulation")
+
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix='musicbot-bench-')
+    server = None
+    try:
+        server = serve_directory(workdir)
+        names = generate_audio(workdir, args.duration, args.codec)
+        audio_urls = [f"http://127.0.0.1:{server.server_address[1]}/{name}" for name in names]
+
+        # The bot reads its configuration at import; keep its files in the scratch directory
+        os.environ.update({
+            'DB_PATH': os.path.join(workdir, 'bench.db'),
+            'MAX_QUEUE_SIZE': str(max(100, args.tracks)),
+            'EXTRACTION_MODE': 'thread',
+            'AUDIO_CACHE_DIR': '',
+            'METRICS_PORT': '',
+            'SHARD_COUNT': '',
+            'BROADCAST_MODE': 'true' if args.broadcast else 'false',
+        })
+        os.environ.pop('CLUSTER_ID', None)
+        os.chdir(workdir)
+        import yt_dlp
+        yt_dlp.YoutubeDL = FakeYoutubeDL
+        import bot as bot_module
+
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'revision': git_revision(),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+            },
+            'config': vars(args),
+            'simulation': asyncio.run(simulate(args, bot_module, audio_urls)),
+        }
+        if not args.skip_queue:
+            report['queue_ops_per_second'] = queue_benchmark(bot_module)
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2, default=str)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,121 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import yt_dlp
 import asyncio
 import os
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import timedelta
 import json
 import aiohttp
 import logging
 from collections import deque
 import random
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename='musicbot.log'
+import heapq
+import sys
+import time
+from functools import partial
+from extraction import ExtractionScheduler, PRIORITY_BACKGROUND, PRIORITY_PLAY_NOW
+from itertools import count
+from audio_cache import AudioCache
+from autocomplete import SearchSuggester
+from broadcast import BroadcastHub
+from audio_filters import (
+    AudioFilters, LoudnessAnalyzer, MAX_BASS_BOOST, MAX_SPEED, MIN_SPEED
 )
+from indexed_list import IndexedList
+from log_setup import setup_logging
+from metadata_cache import MetadataCache, stream_url_expiry, video_key
+from metrics import BotMetrics, MetricsServer
+from player_state import PlayerJournal
+from playlists import PlaylistError, PlaylistStore, track_url
+from stats import EVENT_FINISH, EVENT_PLAY, EVENT_SKIP, StatsRecorder
+from timer_wheel import TimerWheel
 
 # Load environment variables
 load_dotenv()
+CLUSTER_ID = os.getenv('CLUSTER_ID')  # Set by launcher.py for each process of a cluster
+
+# Set up logging; records are written to disk by a background thread
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' for one object per line, 'text' for plain lines
+LOG_MAX_MB = int(os.getenv('LOG_MAX_MB', '50'))  # Rotate the log at this size, 0 never rotates by size
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')  # e.g. 'midnight' rotates on a schedule instead
+LOG_BACKUPS = int(os.getenv('LOG_BACKUPS', '5'))
+log_handler = setup_logging(
+    f'musicbot-cluster{CLUSTER_ID}.log' if CLUSTER_ID else 'musicbot.log',
+    json_format=LOG_FORMAT == 'json',
+    max_bytes=LOG_MAX_MB * 1024 * 1024,
+    backups=LOG_BACKUPS,
+    when=LOG_ROTATE_WHEN
+)
+
 TOKEN = os.getenv('DISCORD_TOKEN')
 MAX_QUEUE_SIZE = int(os.getenv('MAX_QUEUE_SIZE', '100'))
-DEFAULT_VOLUME = float(os.getenv('DEFAULT_VOLUME', '0.5'))
+DEFAULT_VOLUME = float(os.getenv('DEFAULT_VOLUME', '1.0'))
+DB_PATH = os.getenv('DB_PATH', 'musicbot.db')
+METADATA_CACHE_SIZE = int(os.getenv('METADATA_CACHE_SIZE', '5000'))
+PLAYLIST_BATCH_SIZE = 50
+PLAYLIST_LOAD_PAGE = 100  # Saved playlist tracks read from the database at a time
+PLAYLIST_MAX_TRACKS = int(os.getenv('PLAYLIST_MAX_TRACKS', '1000'))
+PLAYLIST_MAX_PER_GUILD = int(os.getenv('PLAYLIST_MAX_PER_GUILD', '25'))
+PLAYLIST_ADD_WAIT = 10  # Seconds /playlist add waits before finishing an import in the background
+QUEUE_PAGE_SIZE = 10
+AUTOCOMPLETE_RESULTS = 8
+AUTOCOMPLETE_BUDGET = 2.5  # Seconds; Discord drops autocomplete answers after 3
+PERSIST_PLAYER_STATE = os.getenv('PERSIST_PLAYER_STATE', 'true').lower() == 'true'
+STATE_SAVE_INTERVAL = 5  # Seconds between saved playback positions
+RESTORE_CONCURRENCY = 10  # Voice connections opened at once when restoring
+PLAYER_IDLE_TIMEOUT = int(os.getenv('PLAYER_IDLE_TIMEOUT', '1800'))  # Seconds without voice before a guild's state is dropped
+PLAYER_EVICT_INTERVAL = 60
+PLAYER_MEMORY_TOP = 10  # Guilds with the largest players exported per metrics scrape
+IDLE_DISCONNECT_TIMEOUT = int(os.getenv('IDLE_DISCONNECT_TIMEOUT', '300'))  # Seconds connected with nothing playing, 0 never leaves
+ALONE_DISCONNECT_TIMEOUT = int(os.getenv('ALONE_DISCONNECT_TIMEOUT', '60'))  # Seconds alone in the voice channel, 0 never leaves
+MAX_DISCONNECT_MINUTES = 1440
+RESTORE_ON_STARTUP = os.getenv('RESTORE_ON_STARTUP', 'true').lower() == 'true'
+STATS_TRACKING = os.getenv('STATS_TRACKING', 'true').lower() == 'true'
+STATS_FLUSH_INTERVAL = 5  # Seconds between batched stats writes
+LEADERBOARD_SIZE = 10
+EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', '4'))
+EXTRACTION_GUILD_LIMIT = int(os.getenv('EXTRACTION_GUILD_LIMIT', '2'))
+EXTRACTION_MODE = os.getenv('EXTRACTION_MODE', 'thread')
 MAX_RETRIES = 3
+PREFETCH_DEPTH = int(os.getenv('PREFETCH_DEPTH', '2'))
+PREFETCH_WARM_SOURCE = os.getenv('PREFETCH_WARM_SOURCE', 'false').lower() == 'true'
+OPUS_PASSTHROUGH = os.getenv('OPUS_PASSTHROUGH', 'true').lower() == 'true'
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', '')  # Empty disables the on-disk audio cache
+AUDIO_CACHE_MAX_MB = int(os.getenv('AUDIO_CACHE_MAX_MB', '2048'))
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv('AUDIO_CACHE_MIN_PLAYS', '3'))
+AUDIO_CACHE_POLICY = os.getenv('AUDIO_CACHE_POLICY', 'lru')
+BROADCAST_MODE = os.getenv('BROADCAST_MODE', 'false').lower() == 'true'  # Share one ffmpeg per source between guilds
+BROADCAST_BUFFER = 30  # Seconds of packets kept per broadcast; guilds starting a track later get their own ffmpeg
+URL_REFRESH_MARGIN = 600  # Re-resolve stream URLs expiring within 10 minutes
+URL_REFRESH_INTERVAL = 30  # Seconds between scans of queued stream URLs
+URL_REFRESH_HORIZON = 1800  # Only songs due to start within this many seconds are refreshed ahead of time
+URL_REFRESH_BATCH = 4  # Most songs refreshed per scan
+URL_REFRESH_LOOKAHEAD = 100  # Most songs per queue looked at per scan
+METRICS_PORT = int(os.getenv('METRICS_PORT') or 0)  # 0 leaves the metrics endpoint off
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+SHARD_COUNT = os.getenv('SHARD_COUNT', '')  # Empty runs unsharded, 'auto' asks Discord for a count
+SHARD_IDS = os.getenv('SHARD_IDS', '')  # Shards this process runs, e.g. "0-3,8"; empty runs all of them
+
+def parse_shard_ids(value):
+    shard_ids = []
+    for part in value.split(','):
+        first, _, last = part.strip().partition('-')
+        shard_ids.extend(range(int(first), int(last or first) + 1))
+    return shard_ids
 
 # Bot configuration
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix='/', intents=intents)
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix='/',
+        intents=intents,
+        shard_count=None if SHARD_COUNT == 'auto' else int(SHARD_COUNT),
+        shard_ids=parse_shard_ids(SHARD_IDS) if SHARD_IDS else None
+    )
+else:
+    bot = commands.Bot(command_prefix='/', intents=intents)
 
 # Enhanced YouTube DL configuration
 yt_dlp_opts = {
@@ -57,53 +143,522 @@ yt_dlp_opts = {
     'cookiefile': 'youtube_cookies.txt'
 }
 
+# Playlists and searches are only listed; entries are resolved right before they play
+yt_dlp_flat_opts = {**yt_dlp_opts, 'extract_flat': 'in_playlist'}
+
+def format_hours(seconds):
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h {rest // 60}m"
+
 class Song:
-    def __init__(self, data, requester):
+    """One queued track. Queues hold thousands of these, so it only keeps ids and plain values."""
+
+    __slots__ = (
+        'id', 'key', 'title', 'url', 'webpage_url', 'duration', 'thumbnail', 'requester_id',
+        'queue_id', 'loudness', 'codec', 'bitrate', 'expires_at', 'counted_size'
+    )
+
+    def __init__(self, data, requester_id=None):
+        self.id = data.get('id')
+        self.key = video_key(data)  # Extractor-qualified id the caches and stats use
         self.title = data.get('title', 'Unknown')
         self.url = data.get('url')
+        self.expires_at = stream_url_expiry(self.url)
+        self.webpage_url = data.get('webpage_url') or data.get('original_url')
         self.duration = data.get('duration', 0)
         self.thumbnail = data.get('thumbnail')
-        self.requester = requester
-        self.timestamp = datetime.now()
+        self.requester_id = requester_id
+        self.queue_id = None
+        self.counted_size = 0  # What MusicQueue added to its running size total for this song
+        self.loudness = None
+        self.set_format(data)
+
+    def set_format(self, data):
+        """Remember the audio codec yt-dlp selected so it doesn't have to be probed."""
+        codec = data.get('acodec')
+        self.codec = codec if codec and codec != 'none' else None
+        self.bitrate = int(data['abr']) if data.get('abr') else None
+
+    def to_dict(self):
+        """Serialize the song with yt-dlp's field names, so ``Song(data, ...)`` restores it."""
+        return {
+            'id': self.id,
+            'extractor_key': self.key.split(':', 1)[0] if self.key else None,
+            'title': self.title,
+            'url': self.url,
+            'webpage_url': self.webpage_url,
+            'duration': self.duration,
+            'thumbnail': self.thumbnail,
+            'acodec': self.codec,
+            'abr': self.bitrate,
+            'queue_id': self.queue_id,
+            'requester_id': self.requester_id,
+        }
+
+    @property
+    def requester(self):
+        """Mention of whoever queued the song; Discord renders it without the member being cached."""
+        return f"<@{self.requester_id}>" if self.requester_id else "Unknown"
+
+    def estimated_size(self):
+        values = (self.id, self.key, self.title, self.url, self.webpage_url, self.thumbnail)
+        return sys.getsizeof(self) + sum(sys.getsizeof(value) for value in values if value is not None)
+
+class QueueFullError(Exception):
+    pass
 
 class MusicQueue:
-    def __init__(self):
-        self.queue = deque(maxlen=MAX_QUEUE_SIZE)
+    """Song queue with O(log n) insert, remove and move by position.
+
+    Every queued song gets a ``queue_id``, which names it in the player journal
+    when one is given, so replaying a remove or move doesn't depend on the
+    positions of other songs. The estimated size
+    of the queued and played songs is kept as a running total.
+    """
+
+    _ids = count(1)
+
+    def __init__(self, guild_id=None, journal=None, capacity=MAX_QUEUE_SIZE):
+        self.queue = IndexedList()
         self.history = deque(maxlen=50)
-        
+        self.capacity = capacity
+        self.guild_id = guild_id
+        self.journal = journal
+        self.song_bytes = 0
+        self.history_bytes = 0
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __iter__(self):
+        return iter(self.queue)
+
     def add(self, song):
-        self.queue.append(song)
-        
+        self.insert(len(self.queue), song)
+
+    def add_many(self, songs):
+        """Append as many songs as fit and return how many were added."""
+        songs = songs[:max(0, self.capacity - len(self.queue))]
+        for song in songs:
+            song.queue_id = next(self._ids)
+            self.song_bytes += self._count(song)
+        self.queue.extend(songs)
+        if songs:
+            self._log('add_many', songs=[song.to_dict() for song in songs])
+        return len(songs)
+
+    def restore(self, songs):
+        """Bulk load songs read back from the journal and start a fresh snapshot."""
+        journal, self.journal = self.journal, None
+        added = self.add_many(songs)
+        self.journal = journal
+        self._snapshot()
+        return added
+
+    def insert(self, index, song):
+        if len(self.queue) >= self.capacity:
+            raise QueueFullError(f"The queue is full ({self.capacity} songs)")
+        song.queue_id = next(self._ids)
+        self.queue.insert(index, song)
+        self.song_bytes += self._count(song)
+        self._log('add', song=song.to_dict(), index=None if index >= len(self.queue) - 1 else index)
+
     def next(self):
         if self.queue:
-            song = self.queue.popleft()
+            song = self.queue.pop(0)
+            self.song_bytes -= song.counted_size
+            if len(self.history) == self.history.maxlen:
+                self.history_bytes -= self.history[0].counted_size
             self.history.append(song)
+            self.history_bytes += song.counted_size
+            self._log('next')
             return song
         return None
+
+    def requeue_history(self):
+        """Queue everything played so far again, for queue loop mode."""
+        self.add_many(list(self.history))
+        self.history.clear()
+        self.history_bytes = 0
     
     def clear(self):
         self.queue.clear()
+        self.song_bytes = 0
+        self._log('clear')
         
     def shuffle(self):
-        temp_queue = list(self.queue)
-        random.shuffle(temp_queue)
-        self.queue = deque(temp_queue, maxlen=MAX_QUEUE_SIZE)
+        songs = list(self.queue)
+        random.shuffle(songs)
+        journal, self.journal = self.journal, None
+        self.clear()
+        self.add_many(songs)
+        self.journal = journal
+        self._snapshot()
         
     def remove(self, index):
         if 0 <= index < len(self.queue):
-            return list(self.queue).pop(index)
+            song = self.queue.pop(index)
+            self.song_bytes -= song.counted_size
+            # Logged last, so a snapshot taken for this entry no longer holds the song
+            self._log('remove', queue_id=song.queue_id)
+            return song
         return None
 
+    def move(self, from_index, to_index):
+        song = self.queue.pop(from_index)
+        self.queue.insert(to_index, song)
+        self._log('move', queue_id=song.queue_id, index=to_index)
+        return song
+
+    def slice(self, start, stop):
+        """Iterate over the songs in ``[start, stop)`` without copying the queue."""
+        return self.queue.slice(start, stop)
+
+    @staticmethod
+    def _count(song):
+        # Remember what was counted, so removing the song subtracts the same amount
+        # even if its URL or title changed while it was queued
+        song.counted_size = song.estimated_size()
+        return song.counted_size
+
+    def _log(self, op, **data):
+        if self.journal is None:
+            return
+        self.journal.log(self.guild_id, op, data)
+        if self.journal.needs_snapshot(self.guild_id):
+            self._snapshot()
+
+    def _snapshot(self):
+        if self.journal is not None:
+            self.journal.snapshot(self.guild_id, [song.to_dict() for song in self.queue])
+
+class FirstPacketSource(discord.AudioSource):
+    """Wraps a source to report, from the player thread, when its first packet is read."""
+
+    def __init__(self, source, on_first_packet):
+        self.source = source
+        self.on_first_packet = on_first_packet
+
+    def read(self):
+        data = self.source.read()
+        if self.on_first_packet is not None:
+            callback, self.on_first_packet = self.on_first_packet, None
+            callback()
+        return data
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+class PlaybackClock:
+    """Tracks how far into the current song playback is, not counting paused time."""
+
+    def __init__(self, offset=0.0, rate=1.0):
+        self.offset = offset
+        self.rate = rate
+        self.started_at = time.monotonic()
+        self.paused_at = None
+
+    def pause(self):
+        if self.paused_at is None:
+            self.paused_at = time.monotonic()
+
+    def resume(self):
+        if self.paused_at is not None:
+            self.started_at += time.monotonic() - self.paused_at
+            self.paused_at = None
+
+    def position(self):
+        now = self.paused_at if self.paused_at is not None else time.monotonic()
+        return self.offset + (now - self.started_at) * self.rate
+
+class GuildPlayer:
+    """All playback state of one guild.
+
+    Players are created on first use and evicted once the guild has had no voice
+    connection for ``PLAYER_IDLE_TIMEOUT`` seconds, so guilds that used the bot
+    once don't keep state forever.
+    """
+
+    __slots__ = (
+        'guild_id', 'queue', 'volume', 'filters', 'now_playing', 'clock', 'loop_mode',
+        'retry_count', 'skipped', 'play_requested', 'track_ended', 'last_active', 'starting'
+    )
+
+    def __init__(self, guild_id, journal=None):
+        self.guild_id = guild_id
+        self.queue = MusicQueue(guild_id, journal)
+        self.volume = DEFAULT_VOLUME
+        self.filters = AudioFilters()
+        self.now_playing = None
+        self.clock = None
+        self.loop_mode = 0
+        self.retry_count = 0
+        self.skipped = False  # The current song was ended by /skip or /stop rather than finishing
+        self.play_requested = None  # When /play was used while idle, for the first-audio metric
+        self.track_ended = None  # When the previous song ended, for the transition gap metric
+        self.last_active = time.monotonic()
+        self.starting = False  # play_next has taken a song off the queue but not started it yet
+
+    def position(self):
+        """Return how many seconds into the current song playback is."""
+        return self.clock.position() if self.clock else 0.0
+
+    def reset(self):
+        """Forget what was playing, e.g. after the bot was disconnected."""
+        self.queue.clear()
+        self.now_playing = None
+        self.clock = None
+        self.retry_count = 0
+        self.play_requested = None
+        self.track_ended = None
+
+    def estimated_size(self):
+        """Approximate bytes held by this player, mostly its songs and their queue nodes; O(1)."""
+        queue = self.queue
+        node_size = sys.getsizeof(queue.queue.root) if queue.queue.root else 0
+        return sys.getsizeof(self) + queue.song_bytes + queue.history_bytes + len(queue) * node_size
+
+class PreparedTrack:
+    def __init__(self, guild_id, song):
+        self.guild_id = guild_id
+        self.song = song
+        self.codec = None
+        self.bitrate = None
+        self.source = None
+        self.task = None
+
+class TrackPrefetcher:
+    """Prepares the next few songs of each guild while the current one plays."""
+
+    def __init__(self, cog, depth=PREFETCH_DEPTH, warm_source=PREFETCH_WARM_SOURCE):
+        self.cog = cog
+        self.depth = depth
+        self.warm_source = warm_source
+        self.prepared = {}
+
+    def upcoming(self, guild_id):
+        """Return the songs play_next will pick next, honouring the loop mode."""
+        if self.depth <= 0:
+            return []
+        player = self.cog.get_player(guild_id)
+        loop_mode = player.loop_mode
+        if loop_mode == 1 and player.now_playing:
+            return [player.now_playing]
+
+        queue = player.queue
+        songs = list(queue.slice(0, self.depth))
+        if loop_mode == 2:
+            for song in queue.history:
+                if len(songs) >= self.depth:
+                    break
+                songs.append(song)
+        return songs
+
+    def schedule(self, guild_id):
+        """Reconcile prepared work with what is currently up next."""
+        wanted = self.upcoming(guild_id)
+        prepared = self.prepared.setdefault(guild_id, {})
+        wanted_keys = [id(song) for song in wanted]
+
+        for key in list(prepared):
+            if key not in wanted_keys:
+                self._discard(prepared.pop(key))
+
+        for index, song in enumerate(wanted):
+            track = prepared.get(id(song))
+            if track is None:
+                track = PreparedTrack(guild_id, song)
+                track.task = asyncio.create_task(self._prepare(guild_id, track))
+                track.task.add_done_callback(self._retrieve)
+                prepared[id(song)] = track
+            elif track.task.done() and not track.task.cancelled() and not track.task.exception():
+                # Only the head of the queue keeps a warm ffmpeg process around
+                if index == 0:
+                    self._warm(track)
+                elif track.source:
+                    track.source.cleanup()
+                    track.source = None
+
+        if not prepared:
+            self.prepared.pop(guild_id, None)
+
+    async def take(self, guild_id, song):
+        """Hand over the prepared track for a song, waiting for it if still in flight."""
+        track = self.prepared.get(guild_id, {}).pop(id(song), None)
+        if track is None:
+            return None
+        if not track.task.done() and track.song.webpage_url:
+            # Playback is waiting on it now, so it mustn't queue behind other background work
+            self.cog.extractor.promote(track.song.webpage_url, guild_id)
+        try:
+            await track.task
+        except Exception as e:
+            logging.warning(f"Prefetch failed for {song.title}: {e}", extra={'guild_id': guild_id, 'song_id': song.id})
+            self._discard(track)
+            return None
+        return track
+
+    def invalidate(self, guild_id, song):
+        """Drop the warm process of a song whose stream URL changed; play_next starts a new one."""
+        track = self.prepared.get(guild_id, {}).get(id(song))
+        if track and track.source:
+            track.source.cleanup()
+            track.source = None
+
+    def cancel(self, guild_id):
+        for track in self.prepared.pop(guild_id, {}).values():
+            self._discard(track)
+
+    def cancel_all(self):
+        for guild_id in list(self.prepared):
+            self.cancel(guild_id)
+
+    async def _prepare(self, guild_id, track):
+        song = track.song
+        await self.cog.resolve_song(song, guild_id, PRIORITY_BACKGROUND)
+        track.codec, track.bitrate = await self.cog.probe_song(song)
+        await self.cog.prepare_filters(guild_id, song)
+
+        upcoming = self.upcoming(guild_id)
+        if upcoming and upcoming[0] is song:
+            self._warm(track)
+
+    def _warm(self, track):
+        """Start a paused ffmpeg process; it blocks on its stdout pipe until playback reads it."""
+        if not self.warm_source or track.source:
+            return
+        try:
+            track.source = self.cog.create_source(track.guild_id, track.song, track.codec, track.bitrate)
+        except Exception as e:
+            logging.warning(f"Failed to warm source for {track.song.title}: {e}")
+
+    @staticmethod
+    def _retrieve(task):
+        # Mark a failure as seen: take() logs it, but a discarded track is never awaited
+        if not task.cancelled():
+            task.exception()
+
+    def _discard(self, track):
+        if track.task and not track.task.done():
+            track.task.cancel()
+        if track.source:
+            track.source.cleanup()
+            track.source = None
+
+class UrlRefresher:
+    """Re-resolves queued stream URLs that would expire before their song is played.
+
+    Every scan estimates when each song of a playing guild starts from the
+    durations queued ahead of it, and refreshes the songs starting within the
+    horizon whose URL won't last until they finish. A scan refreshes at most
+    ``batch`` songs, soonest first, so long queues are refreshed a few songs at
+    a time instead of in one burst of extractions.
+    """
+
+    def __init__(self, cog, interval=URL_REFRESH_INTERVAL, horizon=URL_REFRESH_HORIZON, batch=URL_REFRESH_BATCH):
+        self.cog = cog
+        self.interval = interval
+        self.horizon = horizon
+        self.batch = batch
+        self.failed = {}  # id(song) -> time a failed refresh may be retried
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def due(self):
+        """Return ``(starts_at, guild_id, song)`` for the songs that need a new URL, soonest first."""
+        now = time.time()
+        due = []
+        for guild_id, player in self.cog.players.items():
+            if not player.now_playing:
+                continue
+            speed = player.filters.speed or 1.0
+            starts_at = now + max(0.0, (player.now_playing.duration or 0) - player.position()) / speed
+            for song in player.queue.slice(0, URL_REFRESH_LOOKAHEAD):
+                if starts_at - now > self.horizon:
+                    break
+                ends_at = starts_at + (song.duration or 0) / speed
+                if song.expires_at and song.expires_at < ends_at + URL_REFRESH_MARGIN:
+                    if self.failed.get(id(song), 0) <= now:
+                        due.append((starts_at, guild_id, song))
+                starts_at = ends_at
+        due.sort(key=lambda item: item[0])
+        return due[:self.batch]
+
+    async def refresh_due(self):
+        due = self.due()
+        now = time.time()
+        self.failed = {key: retry_at for key, retry_at in self.failed.items() if retry_at > now}
+        await asyncio.gather(*(self._refresh(starts_at, guild_id, song) for starts_at, guild_id, song in due))
+
+    async def _refresh(self, starts_at, guild_id, song):
+        min_ttl = starts_at + (song.duration or 0) - time.time() + URL_REFRESH_MARGIN
+        try:
+            await self.cog.resolve_song(song, guild_id, PRIORITY_BACKGROUND, min_ttl)
+        except Exception as e:
+            logging.warning(
+                f"Failed to refresh stream URL for {song.title}: {e}", extra={'guild_id': guild_id, 'song_id': song.id}
+            )
+            self.failed[id(song)] = time.time() + self.interval * 10
+            self.cog.metrics.url_refreshes.inc('failed')
+            return
+        self.cog.prefetcher.invalidate(guild_id, song)
+        self.cog.metrics.url_refreshes.inc('refreshed')
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh_due()
+            except Exception as e:
+                logging.error(f"Error refreshing stream URLs: {e}")
+
 class MusicBot(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.yt = yt_dlp.YoutubeDL(yt_dlp_opts)
-        self.queues = {}
-        self.volumes = {}
-        self.now_playing = {}
-        self.loop_mode = {}
+        self.extractor = ExtractionScheduler(
+            yt_dlp_opts, yt_dlp_flat_opts,
+            workers=EXTRACTION_WORKERS,
+            guild_limit=EXTRACTION_GUILD_LIMIT,
+            mode=EXTRACTION_MODE
+        )
+        self.players = {}
+        self.broadcasts = BroadcastHub(BROADCAST_BUFFER) if BROADCAST_MODE else None
         self.session = aiohttp.ClientSession()
-        self.retry_counts = {}
+        self.journal = PlayerJournal(DB_PATH if PERSIST_PLAYER_STATE else None)
+        self.stats = StatsRecorder(DB_PATH if STATS_TRACKING else None, STATS_FLUSH_INTERVAL)
+        self.playlists = PlaylistStore(DB_PATH, PLAYLIST_MAX_TRACKS, PLAYLIST_MAX_PER_GUILD)
+        self.playlist_imports = set()
+        self.metrics = BotMetrics()
+        self.metrics_server = MetricsServer(self.metrics, METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+        self.register_gauges()
+        self.closing = False
+        self.restored = False
+        self.state_task = None
+        self.evict_task = None
+        self.metadata = MetadataCache(DB_PATH, METADATA_CACHE_SIZE)
+        self.prefetcher = TrackPrefetcher(self)
+        self.refresher = UrlRefresher(self)
+        self.idle_timers = TimerWheel(self.disconnect_idle)
+        self.disconnect_timeouts = {}  # guild id -> (idle, alone) seconds set with /autodisconnect
+        self.idle_disconnects = set()  # Guilds left by their idle timer; their queue and saved state are kept
+        self.suggester = SearchSuggester(self.search_suggestions, AUTOCOMPLETE_BUDGET)
+        self.loudness = LoudnessAnalyzer(self.metadata)
+        self.audio_cache = AudioCache(
+            AUDIO_CACHE_DIR,
+            AUDIO_CACHE_MAX_MB * 1024 * 1024,
+            min_plays=AUDIO_CACHE_MIN_PLAYS,
+            policy=AUDIO_CACHE_POLICY,
+            shared=bool(CLUSTER_ID)
+        )
         self.ffmpeg_options = {
             'before_options': (
                 '-reconnect 1 '
@@ -122,86 +677,654 @@ class MusicBot(commands.Cog):
                 '-f opus'
             )
         }
+        # Opus sources are only remuxed, so none of the encoder settings apply
+        self.passthrough_options = {
+            'before_options': self.ffmpeg_options['before_options'],
+            'options': '-vn'
+        }
+        # Files from the audio cache don't need the HTTP reconnect options
+        self.local_before_options = '-loglevel warning'
 
-    async def play_next(self, guild):
-        """Enhanced play_next function with better error handling and retry logic."""
+    async def cog_load(self):
+        """Open the player journal once the bot's event loop is running."""
+        if DEFAULT_VOLUME != 1.0:
+            # Older .env files set 0.5, back when the setting did nothing
+            logging.warning(
+                f"DEFAULT_VOLUME is {DEFAULT_VOLUME}: songs play at {DEFAULT_VOLUME:.0%} volume and are "
+                "transcoded instead of passing Opus through; set DEFAULT_VOLUME=1.0 to avoid both"
+            )
+        self.evict_task = asyncio.create_task(self.evict_idle_players())
+        self.refresher.start()
+        self.idle_timers.start()
+        try:
+            await self.journal.open()
+            if self.journal.enabled:
+                self.state_task = asyncio.create_task(self.save_positions())
+        except Exception as e:
+            logging.error(f"Failed to open player journal, state won't be persisted: {e}")
+            self.journal.db_path = None
+        try:
+            await self.stats.open()
+        except Exception as e:
+            logging.error(f"Failed to open stats database, stats won't be recorded: {e}")
+            self.stats.db_path = None
+        try:
+            await self.playlists.open()
+        except Exception as e:
+            logging.error(f"Failed to open playlist database: {e}")
+        if self.metrics_server:
+            try:
+                await self.metrics_server.start()
+            except Exception as e:
+                logging.error(f"Failed to start metrics endpoint: {e}")
+
+    def register_gauges(self):
+        def ffmpeg_processes():
+            playing = 0
+            for voice_client in self.bot.voice_clients:
+                source = getattr(voice_client.source, 'source', voice_client.source)
+                process = getattr(source, '_process', None)
+                if process is not None and process.poll() is None:
+                    playing += 1
+            warm = sum(
+                track.source is not None
+                for tracks in self.prefetcher.prepared.values() for track in tracks.values()
+            )
+            return {
+                ('playback',): playing,
+                ('broadcast',): len(self.broadcasts) if self.broadcasts is not None else 0,
+                ('prefetch',): warm,
+                ('cache',): len(self.audio_cache.downloads),
+                ('loudness',): len(self.loudness.pending),
+            }
+
+        self.metrics.gauge(
+            'musicbot_queue_depth', 'Songs waiting in each non-empty queue',
+            lambda: {(guild_id,): len(player.queue) for guild_id, player in self.players.items() if player.queue},
+            ('guild',)
+        )
+        self.metrics.gauge(
+            'musicbot_guild_players', 'Guilds with player state in memory', lambda: {(): len(self.players)}
+        )
+        if self.broadcasts is not None:
+            self.metrics.gauge(
+                'musicbot_broadcast_listeners', 'Guilds reading a shared broadcast instead of their own ffmpeg',
+                lambda: {(): self.broadcasts.listeners()}
+            )
+            self.metrics.counter(
+                'musicbot_broadcast_joins_total', 'Plays that joined a running broadcast instead of starting ffmpeg',
+                lambda: {(): self.broadcasts.joined}
+            )
+        self.metrics.gauge(
+            'musicbot_idle_timers', 'Voice connections counting down to an automatic disconnect',
+            lambda: {(): len(self.idle_timers)}
+        )
+        self.metrics.counter(
+            'musicbot_idle_timers_fired_total', 'Automatic disconnect timers that ran out',
+            lambda: {(): self.idle_timers.fired}
+        )
+        self.metrics.gauge(
+            'musicbot_player_memory_bytes', 'Estimated memory held by all guild players',
+            lambda: {(): sum(player.estimated_size() for player in self.players.values())}
+        )
+        self.metrics.gauge(
+            'musicbot_player_memory_top_bytes', f'Estimated memory of the {PLAYER_MEMORY_TOP} largest guild players',
+            lambda: {
+                (guild_id,): size for size, guild_id in heapq.nlargest(
+                    PLAYER_MEMORY_TOP, ((player.estimated_size(), guild_id) for guild_id, player in self.players.items())
+                )
+            },
+            ('guild',)
+        )
+        if AUDIO_CACHE_DIR:
+            self.metrics.counter(
+                'musicbot_audio_cache_hits_total', 'Plays read from the on-disk audio cache',
+                lambda: {(): self.audio_cache.hits}
+            )
+        self.metrics.counter(
+            'musicbot_autocomplete_early_answers_total',
+            'Autocomplete answers given without a search: cached, or filtered from a shorter query',
+            lambda: {('cache',): self.suggester.hits, ('prefix',): self.suggester.partial}, ('source',)
+        )
+        self.metrics.counter(
+            'musicbot_autocomplete_timeouts_total', 'Autocomplete searches that missed the response budget',
+            lambda: {(): self.suggester.timeouts}
+        )
+        self.metrics.counter(
+            'musicbot_log_records_dropped_total', 'Log records dropped because the log writer fell behind',
+            lambda: {(): log_handler.dropped}
+        )
+        self.metrics.gauge(
+            'musicbot_voice_clients', 'Connected voice clients', lambda: {(): len(self.bot.voice_clients)}
+        )
+        self.metrics.gauge(
+            'musicbot_ffmpeg_processes', 'Live ffmpeg processes by what they are for', ffmpeg_processes, ('role',)
+        )
+        self.metrics.gauge(
+            'musicbot_extraction_queue', 'Extractions waiting for a worker',
+            lambda: {
+                ('play_now',): self.extractor.queue_depth(PRIORITY_PLAY_NOW),
+                ('background',): self.extractor.queue_depth(PRIORITY_BACKGROUND),
+            }, ('priority',)
+        )
+        self.metrics.gauge(
+            'musicbot_extractions_active', 'Extractions running on a worker', lambda: {(): self.extractor.active}
+        )
+        self.metrics.counter(
+            'musicbot_extractions_started_total', 'Extractions handed to a worker',
+            lambda: {(): self.extractor.started}
+        )
+        self.metrics.counter(
+            'musicbot_extractions_total', 'Extractions that ended, by how they ended',
+            lambda: {
+                ('completed',): self.extractor.completed,
+                ('failed',): self.extractor.failed,
+                ('cancelled',): self.extractor.cancelled,
+            }, ('result',)
+        )
+        self.metrics.counter(
+            'musicbot_extraction_wait_seconds_total', 'Time started extractions spent waiting for a worker',
+            lambda: {(): self.extractor.wait_total}
+        )
+        self.metrics.gauge(
+            'musicbot_extraction_wait_max_seconds', 'Longest any extraction has waited for a worker',
+            lambda: {(): self.extractor.wait_max}
+        )
+        self.metrics.counter(
+            'musicbot_metadata_cache_lookups_total',
+            'Metadata lookups: answered from the cache, joined an extraction in flight, or extracted',
+            lambda: {
+                ('hit',): self.metadata.hits,
+                ('coalesced',): self.metadata.coalesced,
+                ('miss',): self.metadata.misses,
+            }, ('result',)
+        )
+
+    def first_packet(self, guild_id):
+        """Record how long the listener waited for audio; runs on the event loop."""
+        player = self.players.get(guild_id)
+        if player is None:
+            return
+        now = time.monotonic()
+        if player.play_requested is not None:
+            self.metrics.first_audio.observe(now - player.play_requested)
+            player.play_requested = None
+        if player.track_ended is not None:
+            self.metrics.transition_gap.observe(now - player.track_ended)
+            player.track_ended = None
+
+    def save_player_state(self, guild):
+        """Record where a guild's playback is, so it can be resumed after a restart."""
+        voice_client = guild.voice_client
+        if not voice_client or self.closing:
+            return
+        player = self.get_player(guild.id)
+        song = player.now_playing
+        self.journal.save_state(guild.id, {
+            'channel_id': voice_client.channel.id,
+            'now_playing': song.to_dict() if song else None,
+            'position': player.position(),
+            'paused': voice_client.is_paused(),
+            'loop_mode': player.loop_mode,
+            'volume': player.volume,
+        })
+
+    async def save_positions(self):
+        while True:
+            await asyncio.sleep(STATE_SAVE_INTERVAL)
+            for voice_client in self.bot.voice_clients:
+                if voice_client.is_playing():
+                    self.save_player_state(voice_client.guild)
+
+    async def restore_players(self):
+        """Rejoin voice and resume every guild saved in the journal, without re-extracting."""
+        if self.restored or not self.journal.enabled:
+            return
+        self.restored = True
+        try:
+            saved = await self.journal.load()
+        except Exception as e:
+            logging.error(f"Failed to load player journal: {e}")
+            return
+
+        semaphore = asyncio.Semaphore(RESTORE_CONCURRENCY)
+
+        async def restore(guild_id, data):
+            async with semaphore:
+                try:
+                    await self.restore_guild(guild_id, data)
+                except Exception as e:
+                    logging.error(f"Failed to restore player for guild {guild_id}: {e}")
+                    self.journal.forget(guild_id)
+
+        await asyncio.gather(*(restore(guild_id, data) for guild_id, data in saved.items()))
+        logging.info(f"Restored players for {len(saved)} guild(s)")
+
+    def owns_guild(self, guild_id):
+        """Whether a guild is served by this process rather than another one of the cluster."""
+        shard_ids = getattr(self.bot, 'shard_ids', None)
+        if not shard_ids or not self.bot.shard_count:
+            return True
+        return (guild_id >> 22) % self.bot.shard_count in shard_ids
+
+    async def restore_guild(self, guild_id, data):
+        if not self.owns_guild(guild_id):
+            return
+        guild = self.bot.get_guild(guild_id)
+        state = data['state']
+        channel = guild.get_channel(state['channel_id']) if guild and state and state['channel_id'] else None
+        if guild is None or state is None or (channel is None and state['channel_id']):
+            self.journal.forget(guild_id)
+            return
+
+        player = self.get_player(guild.id)
+        queue = player.queue
+        queue.restore([Song(song, song.get('requester_id')) for song in data['queue']])
+        player.loop_mode = state.get('loop_mode', 0)
+        player.volume = state.get('volume', DEFAULT_VOLUME)
+        if channel is None:
+            # Left by its idle timer; the queue waits for the next /play
+            return
+
+        if not guild.voice_client:
+            await self.create_voice_client(channel)
+        if state.get('now_playing'):
+            now_playing = state['now_playing']
+            await self.play_next(guild, Song(now_playing, now_playing.get('requester_id')), state.get('position', 0))
+            if state.get('paused') and guild.voice_client.is_playing():
+                guild.voice_client.pause()
+                player.clock.pause()
+        elif queue:
+            await self.play_next(guild)
+        # Restored into a channel everyone has left, or with nothing left to play
+        self.update_idle_timer(guild)
+
+    async def extract_info(self, query, guild_id=None, priority=PRIORITY_PLAY_NOW, flat=False):
+        """Run a yt-dlp extraction on the worker pool, bypassing the metadata cache."""
+        started = time.monotonic()
+        try:
+            return await self.extractor.extract(query, guild_id, flat=flat, priority=priority)
+        finally:
+            self.metrics.extract_latency.observe(time.monotonic() - started, 'flat' if flat else 'full')
+
+    async def search_suggestions(self, text):
+        # No guild id: every guild's autocomplete shares one lane of the extraction pool,
+        # so fast typists can't crowd out playback
+        data = await self.metadata.extract(
+            f"ytsearch{AUTOCOMPLETE_RESULTS}:{text}",
+            partial(self.extract_info, flat=True),
+            flat=True
+        )
+        return [
+            (entry.get('title') or entry['webpage_url'], entry['webpage_url'], entry.get('duration'))
+            for entry in data.get('entries') or [] if entry and entry.get('webpage_url')
+        ]
+
+    async def resolve_song(self, song, guild_id=None, priority=PRIORITY_PLAY_NOW, min_ttl=URL_REFRESH_MARGIN):
+        """Fill in or refresh a song's stream URL so it stays valid for ``min_ttl`` seconds.
+
+        Songs are re-resolved from their video page, which the metadata cache keys
+        by video id, so the search that queued them is never run again.
+        """
+        if self.audio_cache.path_for(song.key):
+            return
+        if song.url and not (song.expires_at and song.expires_at - time.time() < min_ttl):
+            return
+        if not song.webpage_url:
+            if not song.url:
+                raise Exception(f"No source to resolve {song.title} from")
+            return
+
+        try:
+            data = await self.metadata.extract(
+                song.webpage_url,
+                partial(self.extract_info, guild_id=guild_id, priority=priority),
+                min_ttl=min_ttl
+            )
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            # The scheduler dropped the guild's extractions, e.g. because it left voice
+            raise Exception(f"Resolving {song.title} was cancelled") from None
+        song.url = data.get('url') or song.url
+        song.key = video_key(data) or song.key
+        song.expires_at = stream_url_expiry(song.url)
+        song.title = data.get('title', song.title)
+        song.duration = data.get('duration') or song.duration
+        song.thumbnail = data.get('thumbnail') or song.thumbnail
+        song.set_format(data)
+        if not song.url:
+            raise Exception(f"No stream URL found for {song.title}")
+
+    async def probe_song(self, song):
+        """Return a song's codec and bitrate, only running ffprobe when yt-dlp didn't say."""
+        if self.audio_cache.path_for(song.key):
+            return 'opus', None
+        if song.codec:
+            return song.codec, song.bitrate
+        started = time.monotonic()
+        try:
+            return await discord.FFmpegOpusAudio.probe(song.url)
+        finally:
+            self.metrics.probe_latency.observe(time.monotonic() - started)
+
+    def get_filters(self, guild_id):
+        return self.get_player(guild_id).filters
+
+    async def prepare_filters(self, guild_id, song):
+        """Load what the guild's filters need for a song, analysing its loudness if unknown."""
+        if not self.get_filters(guild_id).normalize or not song.key or song.loudness:
+            return
+        song.loudness = await self.metadata.loudness(song.key)
+        if not song.loudness:
+            # This play normalizes in single-pass mode; later ones use the measurement
+            self.loudness.analyze(song)
+
+    def create_source(self, guild_id, song, codec, bitrate, position=0):
+        """Create an audio source from known codec information.
+
+        Volume and filters run in ffmpeg's filter graph. Opus input with nothing
+        to filter is remuxed as-is (``codec='copy'``); anything else is transcoded.
+        A ``position`` is applied as an input-side ``-ss`` so ffmpeg seeks instead
+        of decoding everything before it. Tracks in the audio cache are read from disk.
+
+        In broadcast mode, guilds starting the same song with the same settings
+        share one ffmpeg process; see ``BroadcastHub``.
+        """
+        player = self.get_player(guild_id)
+        chain = player.filters.chain(player.volume, song.loudness)
+        passthrough = OPUS_PASSTHROUGH and codec in ('opus', 'libopus') and not chain
+        options = dict(self.passthrough_options if passthrough else self.ffmpeg_options)
+        source = self.audio_cache.path_for(song.key)
+        if source:
+            options['before_options'] = self.local_before_options
+        else:
+            source = song.url
+        if chain:
+            options['options'] = f"{options['options']} -af {chain}"
+
+        def spawn(position):
+            spawn_options = dict(options)
+            if position:
+                spawn_options['before_options'] = f"-ss {position:.3f} {options['before_options']}"
+            # Any codec discord.py doesn't recognise as Opus is encoded with libopus
+            return discord.FFmpegOpusAudio(
+                source, codec='copy' if passthrough else None, bitrate=bitrate, **spawn_options
+            )
+
+        started = time.monotonic()
+        if self.broadcasts is not None and not position:
+            key = (song.key or source, chain, passthrough, bitrate)
+            audio_source = self.broadcasts.subscribe(key, spawn, live=not song.duration)
+        else:
+            audio_source = spawn(position)
+        self.metrics.spawn_latency.observe(time.monotonic() - started)
+        return audio_source
+
+    def position(self, guild_id):
+        """Return how many seconds into the current song playback is."""
+        player = self.players.get(guild_id)
+        return player.position() if player else 0.0
+
+    async def restart_source(self, guild, position):
+        """Swap the playing source for one starting at ``position`` seconds.
+
+        The source is replaced in place, so ``after_playing`` doesn't fire and the
+        queue doesn't advance.
+        """
+        voice_client = guild.voice_client
+        player = self.get_player(guild.id)
+        song = player.now_playing
+        await self.resolve_song(song, guild.id)
+        codec, bitrate = await self.probe_song(song)
+        await self.prepare_filters(guild.id, song)
+        source = self.create_source(guild.id, song, codec, bitrate, position)
+
+        old_source = voice_client.source
+        paused = voice_client.is_paused()
+        voice_client.source = source
+        clock = PlaybackClock(position, self.get_filters(guild.id).speed)
+        if paused:
+            voice_client.pause()
+            clock.pause()
+        player.clock = clock
+        # The player thread may still be reading the old source for one more frame
+        asyncio.get_event_loop().call_later(1, old_source.cleanup)
+
+    async def apply_filters(self, guild):
+        """Restart the current song at its position so new volume/filter settings take effect."""
+        # Warm sources of upcoming songs were built with the old settings
+        self.prefetcher.cancel(guild.id)
+        voice_client = guild.voice_client
+        if voice_client and (voice_client.is_playing() or voice_client.is_paused()) and self.get_player(guild.id).now_playing:
+            await self.restart_source(guild, self.position(guild.id))
+        self.prefetcher.schedule(guild.id)
+
+    async def play_next(self, guild, resume=None, position=0):
+        """Enhanced play_next function with better error handling and retry logic.
+
+        ``resume`` plays a restored song from ``position`` instead of taking the next one.
+        Calls made while another one is still starting a song, or while a song
+        is already playing, return right away; the songs they were meant for stay queued.
+        """
+        player = self.get_player(guild.id)
+        voice_client = guild.voice_client
+        if player.starting or (not resume and voice_client and (voice_client.is_playing() or voice_client.is_paused())):
+            return
+        if guild.id in self.idle_disconnects:
+            # The song that was stopped by leaving must not take the next one off the queue
+            return
+        player.starting = True
+        try:
+            await self._start_next(guild, resume, position)
+        finally:
+            player.starting = False
+
+    async def _start_next(self, guild, resume=None, position=0):
         try:
             if not guild.voice_client or not guild.voice_client.is_connected():
                 return
 
-            queue = self.get_queue(guild.id)
+            player = self.get_player(guild.id)
+            queue = player.queue
             
-            if self.loop_mode.get(guild.id) == 1 and self.now_playing.get(guild.id):
-                song = self.now_playing[guild.id]
+            if resume:
+                song = resume
+            elif player.loop_mode == 1 and player.now_playing:
+                song = player.now_playing
             else:
                 song = queue.next()
-                if not song and self.loop_mode.get(guild.id) == 2:
-                    queue.queue.extend(queue.history)
-                    queue.history.clear()
+                if not song and player.loop_mode == 2:
+                    queue.requeue_history()
                     song = queue.next()
             
             if not song:
-                self.retry_counts[guild.id] = 0
+                player.retry_count = 0
+                player.track_ended = None
+                self.update_idle_timer(guild, activity=True)
                 return
 
-            if guild.id not in self.retry_counts:
-                self.retry_counts[guild.id] = 0
-
-            self.now_playing[guild.id] = song
+            player.now_playing = song
+            started = time.monotonic()
+            context = {'guild_id': guild.id, 'song_id': song.id}
 
             try:
-                # Create audio source with enhanced error handling and buffering
-                audio_source = await discord.FFmpegOpusAudio.from_probe(
-                    song.url,
-                    **self.ffmpeg_options
-                )
+                # Use the lookahead's probe (and warm process) when it got to this song first
+                track = await self.prefetcher.take(guild.id, song)
+                if track and track.source:
+                    audio_source = track.source
+                elif track:
+                    audio_source = self.create_source(guild.id, song, track.codec, track.bitrate)
+                else:
+                    await self.resolve_song(song, guild.id)
+                    codec, bitrate = await self.probe_song(song)
+                    await self.prepare_filters(guild.id, song)
+                    audio_source = self.create_source(guild.id, song, codec, bitrate, position)
                 
                 def after_playing(error):
+                    # Runs on the player thread; the stats buffer is only touched from the loop
+                    event = EVENT_SKIP if player.skipped else EVENT_FINISH
+                    player.skipped = False
+                    if not error:
+                        self.bot.loop.call_soon_threadsafe(
+                            self.stats.record, event, guild.id, song, player.position()
+                        )
+                        player.track_ended = time.monotonic()
                     if error:
-                        logging.error(f"Error during playback: {error}")
-                        if self.retry_counts.get(guild.id, 0) < MAX_RETRIES:
-                            self.retry_counts[guild.id] = self.retry_counts.get(guild.id, 0) + 1
+                        logging.error(
+                            f"Error during playback: {error}",
+                            extra={**context, 'played_seconds': round(player.position(), 1)}
+                        )
+                        if player.retry_count < MAX_RETRIES:
+                            player.retry_count += 1
+                            self.bot.loop.call_soon_threadsafe(self.metrics.retries.inc, 'after_playing')
                             asyncio.run_coroutine_threadsafe(
                                 self.play_next(guild), self.bot.loop
                             )
                         else:
-                            logging.error(f"Max retries reached for guild {guild.id}")
-                            self.retry_counts[guild.id] = 0
+                            logging.error(f"Max retries reached for guild {guild.id}", extra=context)
+                            player.retry_count = 0
                             asyncio.run_coroutine_threadsafe(
                                 self.cleanup_voice_client(guild), self.bot.loop
                             )
                     else:
-                        self.retry_counts[guild.id] = 0
+                        player.retry_count = 0
                         asyncio.run_coroutine_threadsafe(
                             self.play_next(guild), self.bot.loop
                         )
 
+                if self.metrics_server:
+                    audio_source = FirstPacketSource(
+                        audio_source, lambda: self.bot.loop.call_soon_threadsafe(self.first_packet, guild.id)
+                    )
                 guild.voice_client.play(audio_source, after=after_playing)
-                
-                if guild.id in self.volumes:
-                    guild.voice_client.source.volume = self.volumes[guild.id]
-                else:
-                    guild.voice_client.source.volume = DEFAULT_VOLUME
+                player.clock = PlaybackClock(position, player.filters.speed)
+                # Playing doesn't stop the timer of a bot left alone in its channel
+                self.update_idle_timer(guild)
+                self.audio_cache.record_play(song)
+                self.save_player_state(guild)
+                if not resume:
+                    self.stats.record(EVENT_PLAY, guild.id, song)
+
+                self.prefetcher.schedule(guild.id)
+                logging.info(
+                    f"Playing {song.title}",
+                    extra={
+                        **context,
+                        'prefetched': track is not None,
+                        'start_ms': round((time.monotonic() - started) * 1000)
+                    }
+                )
 
             except Exception as e:
-                logging.error(f"Error playing audio: {e}")
-                if self.retry_counts.get(guild.id, 0) < MAX_RETRIES:
-                    self.retry_counts[guild.id] = self.retry_counts.get(guild.id, 0) + 1
+                logging.error(
+                    f"Error playing audio: {e}",
+                    extra={
+                        **context,
+                        'retry': player.retry_count,
+                        'elapsed_ms': round((time.monotonic() - started) * 1000)
+                    }
+                )
+                if player.retry_count < MAX_RETRIES:
+                    player.retry_count += 1
+                    self.metrics.retries.inc('play_next')
                     await asyncio.sleep(1)
-                    await self.play_next(guild)
+                    await self._start_next(guild)
                 else:
-                    self.retry_counts[guild.id] = 0
-                    logging.error(f"Failed to play audio after {MAX_RETRIES} attempts")
+                    player.retry_count = 0
+                    logging.error(f"Failed to play audio after {MAX_RETRIES} attempts", extra=context)
                     await self.cleanup_voice_client(guild)
 
         except Exception as e:
-            logging.error(f"Error in play_next: {e}")
+            logging.error(f"Error in play_next: {e}", extra={'guild_id': guild.id})
             await self.cleanup_voice_client(guild)
         
     def get_queue(self, guild_id):
-        if guild_id not in self.queues:
-            self.queues[guild_id] = MusicQueue()
-        return self.queues[guild_id]
+        return self.get_player(guild_id).queue
+
+    def get_player(self, guild_id):
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = GuildPlayer(guild_id, self.journal)
+        player.last_active = time.monotonic()
+        return player
+
+    async def evict_idle_players(self):
+        """Drop the state of guilds that have been without a voice connection for a while."""
+        while True:
+            await asyncio.sleep(PLAYER_EVICT_INTERVAL)
+            cutoff = time.monotonic() - PLAYER_IDLE_TIMEOUT
+            for guild_id, player in list(self.players.items()):
+                guild = self.bot.get_guild(guild_id)
+                if player.last_active < cutoff and not (guild and guild.voice_client):
+                    del self.players[guild_id]
+                    self.prefetcher.cancel(guild_id)
+                    self.journal.forget(guild_id)
+
+    def idle_reason(self, guild):
+        """Return why a guild's voice connection is idle ('alone' or 'idle'), or None while it's in use."""
+        voice_client = guild.voice_client
+        if not voice_client or not voice_client.is_connected():
+            return None
+        if not any(not member.bot for member in voice_client.channel.members):
+            return 'alone'
+        if not (voice_client.is_playing() or voice_client.is_paused()):
+            return 'idle'
+        return None
+
+    def update_idle_timer(self, guild, activity=False):
+        """Start, restart or stop a guild's auto-disconnect timer after its voice state changed.
+
+        A running timer for the same reason is only restarted on ``activity``,
+        so unrelated voice updates don't keep an idle bot connected.
+        """
+        reason = self.idle_reason(guild)
+        idle_timeout, alone_timeout = self.disconnect_timeouts.get(
+            guild.id, (IDLE_DISCONNECT_TIMEOUT, ALONE_DISCONNECT_TIMEOUT)
+        )
+        timeout = {'alone': alone_timeout, 'idle': idle_timeout}.get(reason)
+        if not timeout:
+            self.idle_timers.cancel(guild.id)
+        elif activity or self.idle_timers.tag(guild.id) != reason:
+            self.idle_timers.reset(guild.id, timeout, reason)
+
+    async def disconnect_idle(self, guild_id, reason):
+        """Leave a voice channel whose idle timer ran out.
+
+        The queue, loop mode, volume and filters stay, in memory and in the
+        journal, for the next /play; the player is evicted like any other once
+        it has been unused for ``PLAYER_IDLE_TIMEOUT`` seconds.
+        """
+        guild = self.bot.get_guild(guild_id)
+        if guild is None or self.closing:
+            return
+        if self.idle_reason(guild) != reason:
+            # Something changed without resetting the timer; start over from the current state
+            self.update_idle_timer(guild)
+            return
+        logging.info(f"Leaving voice in guild {guild_id}: {reason}", extra={'guild_id': guild_id})
+        self.idle_disconnects.add(guild_id)
+        self.prefetcher.cancel(guild_id)
+        self.extractor.cancel_guild(guild_id)
+        player = self.players.get(guild_id)
+        if player:
+            player.now_playing = None
+            player.clock = None
+            player.play_requested = None
+            player.track_ended = None
+            # Without a channel a restart restores the queue but doesn't rejoin
+            self.journal.save_state(guild_id, {
+                'channel_id': None,
+                'now_playing': None,
+                'position': 0,
+                'paused': False,
+                'loop_mode': player.loop_mode,
+                'volume': player.volume,
+            })
+        try:
+            await guild.voice_client.disconnect(force=True)
+        except Exception as e:
+            logging.error(f"Error leaving idle voice channel: {e}", extra={'guild_id': guild_id})
 
     @app_commands.command(name="help", description="Show all available commands")
     async def help(self, interaction: discord.Interaction):
@@ -215,13 +1338,20 @@ class MusicBot(commands.Cog):
             "nowplaying": "Show current song information",
             "queue": "Show the current queue",
             "volume": "Set playback volume (0-100)",
+            "filters": "Set audio filters (normalize, bass boost, speed)",
             "loop": "Set loop mode (off/single/queue)",
             "shuffle": "Shuffle the current queue",
             "remove": "Remove a song from the queue",
             "history": "Show recently played songs",
             "seek": "Seek to a position in the song",
             "lyrics": "Get lyrics for the current song",
-            "leave": "Disconnect the bot from voice"
+            "playlist": "Create, fill, load, list and delete saved playlists",
+            "stats": "Show bot statistics",
+            "mystats": "Show your listening statistics",
+            "topplayed": "Show the most played songs",
+            "servertop": "Show this server's top tracks",
+            "leave": "Disconnect the bot from voice",
+            "autodisconnect": "Set when the bot leaves an idle or empty voice channel"
         }
         
         for cmd, desc in commands.items():
@@ -231,6 +1361,16 @@ class MusicBot(commands.Cog):
 
     async def cleanup_voice_client(self, guild):
         """Safely clean up voice client resources."""
+        self.metrics.cleanups.inc()
+        self.prefetcher.cancel(guild.id)
+        self.extractor.cancel_guild(guild.id)
+        player = self.players.get(guild.id)
+        if player:
+            player.clock = None
+            player.play_requested = None
+            player.track_ended = None
+        if not self.closing:
+            self.journal.forget(guild.id)
         if guild.voice_client:
             try:
                 if guild.voice_client.is_playing():
@@ -241,6 +1381,7 @@ class MusicBot(commands.Cog):
 
     async def create_voice_client(self, channel):
         """Create a voice client with retry logic."""
+        self.idle_disconnects.discard(channel.guild.id)
         retries = 0
         while retries < MAX_RETRIES:
             try:
@@ -259,42 +1400,151 @@ class MusicBot(commands.Cog):
             return
             
         await interaction.response.defer()
-        
+        guild = interaction.guild
+        player = self.get_player(guild.id)
+        voice_client = guild.voice_client
+        if not voice_client or not (voice_client.is_playing() or voice_client.is_paused()):
+            player.play_requested = time.monotonic()
+        # Reset retry counter when starting new playback
+        player.retry_count = 0
+
+        # Join the channel while the query is resolved instead of one after the other
+        extract = asyncio.create_task(self.metadata.extract(
+            query,
+            partial(self.extract_info, guild_id=guild.id, flat=True),
+            min_ttl=URL_REFRESH_MARGIN,
+            flat=True
+        ))
+        connect = None
+        if not voice_client:
+            connect = asyncio.create_task(self.create_voice_client(interaction.user.voice.channel))
+        message = await interaction.followup.send(
+            "🔎 Searching and joining your voice channel..." if connect else "🔎 Searching...", wait=True
+        )
+        if connect and not extract.done():
+            await asyncio.wait((extract, connect), return_when=asyncio.FIRST_COMPLETED)
+            if connect.done() and not connect.cancelled() and not connect.exception() and not extract.done():
+                await message.edit(content="🔎 Joined your voice channel, still searching...")
+
         try:
-            if not interaction.guild.voice_client:
-                await self.create_voice_client(interaction.user.voice.channel)
-            
-            # Reset retry counter when starting new playback
-            self.retry_counts[interaction.guild.id] = 0
-            
-            loop = asyncio.get_event_loop()
-            data = await loop.run_in_executor(None, lambda: self.yt.extract_info(query, download=False))
-            
-            if 'entries' in data:
-                entries = data['entries']
-                await interaction.followup.send(f"📑 Adding {len(entries)} songs from playlist...")
-                
-                for entry in entries:
-                    song = Song(entry, interaction.user)
-                    self.get_queue(interaction.guild.id).add(song)
-                    
+            data = await extract
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            # The guild's extractions were dropped, e.g. by /stop or the bot leaving voice
+            await message.edit(content="❌ The search was cancelled")
+            if connect:
+                await self.leave_if_unused(guild, connect)
+            return
+        except Exception as e:
+            logging.error(f"Error resolving {query!r} in play command: {e}", extra={'guild_id': guild.id})
+            await message.edit(content=f"❌ Couldn't find anything to play: {e}")
+            if connect:
+                await self.leave_if_unused(guild, connect)
+            return
+        entries = [data] if 'entries' not in data else [
+            entry for entry in data['entries'] if entry and (entry.get('url') or entry.get('webpage_url'))
+        ]
+        if not entries:
+            await message.edit(content="❌ Nothing playable was found")
+            if connect:
+                await self.leave_if_unused(guild, connect)
+            return
+
+        # The bot may have been disconnected while the query was resolved
+        if connect is None and not guild.voice_client:
+            connect = asyncio.create_task(self.create_voice_client(interaction.user.voice.channel))
+        if connect:
+            if not connect.done():
+                await message.edit(content="🔊 Joining your voice channel...")
+            try:
+                await connect
+            except Exception as e:
+                logging.error(f"Error connecting to voice in play command: {e}", extra={'guild_id': guild.id})
+                await message.edit(content="❌ Couldn't join your voice channel, please try again")
+                await self.cleanup_voice_client(guild)
+                return
+
+        try:
+            queue = player.queue
+            if len(entries) == 1:
+                song = Song(entries[0], interaction.user.id)
+                try:
+                    queue.add(song)
+                except QueueFullError as e:
+                    await message.edit(content=f"❌ {e}")
+                    return
+                await message.edit(content=f"🎵 Added to queue: {song.title}")
+                await self.start_or_prefetch(guild)
+                return
+
+            await message.edit(content=f"📑 Adding {len(entries)} songs from playlist...")
+            # Queue placeholders in batches so playback starts with the first one
+            added = 0
+            for start in range(0, len(entries), PLAYLIST_BATCH_SIZE):
+                batch = [Song(entry, interaction.user.id) for entry in entries[start:start + PLAYLIST_BATCH_SIZE]]
+                added += queue.add_many(batch)
+                if start == 0 and added:
+                    await self.start_or_prefetch(guild)
+                if added < start + len(batch):
+                    break
+                if added < len(entries):
+                    await message.edit(content=f"📑 Adding songs from playlist... {added}/{len(entries)}")
+                await asyncio.sleep(0)
+            self.prefetcher.schedule(guild.id)
+            title = data.get('title') or 'playlist'
+            if added < len(entries):
+                await message.edit(
+                    content=f"📑 Added {added} of {len(entries)} songs from {title} (queue is full)"
+                )
             else:
-                song = Song(data, interaction.user)
-                self.get_queue(interaction.guild.id).add(song)
-                await interaction.followup.send(f"🎵 Added to queue: {song.title}")
-            
-            if not interaction.guild.voice_client.is_playing():
-                await self.play_next(interaction.guild)
+                await message.edit(content=f"📑 Added {len(entries)} songs from {title}")
                 
         except Exception as e:
-            logging.error(f"Error in play command: {str(e)}")
-            await interaction.followup.send(f"❌ An error occurred: {str(e)}")
-            await self.cleanup_voice_client(interaction.guild)
+            # Playback errors are retried in play_next; the connection is left alone here
+            logging.error(f"Error in play command: {str(e)}", extra={'guild_id': guild.id})
+            await message.edit(content=f"❌ An error occurred: {str(e)}")
+
+    async def leave_if_unused(self, guild, connect):
+        """Leave a channel joined for a /play that found nothing, unless something else is queued."""
+        try:
+            await connect
+        except Exception:
+            return
+        voice_client = guild.voice_client
+        player = self.players.get(guild.id)
+        if not voice_client or voice_client.is_playing() or voice_client.is_paused():
+            return
+        if player and (player.queue or player.now_playing):
+            return
+        await voice_client.disconnect(force=True)
+
+    @play.autocomplete('query')
+    async def play_autocomplete(self, interaction: discord.Interaction, current: str):
+        choices = []
+        for title, url, duration in await self.suggester.suggest(interaction.user.id, current):
+            if len(url) > 100:
+                continue
+            suffix = f" ({timedelta(seconds=int(duration))})" if duration else ''
+            choices.append(app_commands.Choice(name=title[:100 - len(suffix)] + suffix, value=url))
+        return choices
+
+    async def start_or_prefetch(self, guild):
+        """Start playback if the guild is idle, otherwise prepare the newly queued songs."""
+        voice_client = guild.voice_client
+        if voice_client.is_playing() or voice_client.is_paused() or self.get_player(guild.id).starting:
+            self.prefetcher.schedule(guild.id)
+        else:
+            await self.play_next(guild)
 
     @app_commands.command(name="pause", description="Pause the current song")
     async def pause(self, interaction: discord.Interaction):
         if interaction.guild.voice_client and interaction.guild.voice_client.is_playing():
             interaction.guild.voice_client.pause()
+            clock = self.get_player(interaction.guild.id).clock
+            if clock:
+                clock.pause()
+            self.update_idle_timer(interaction.guild, activity=True)
             await interaction.response.send_message("⏸️ Playback paused")
         else:
             await interaction.response.send_message("Nothing is playing!")
@@ -303,6 +1553,10 @@ class MusicBot(commands.Cog):
     async def resume(self, interaction: discord.Interaction):
         if interaction.guild.voice_client and interaction.guild.voice_client.is_paused():
             interaction.guild.voice_client.resume()
+            clock = self.get_player(interaction.guild.id).clock
+            if clock:
+                clock.resume()
+            self.update_idle_timer(interaction.guild, activity=True)
             await interaction.response.send_message("▶️ Playback resumed")
         else:
             await interaction.response.send_message("Nothing is paused!")
@@ -313,39 +1567,47 @@ class MusicBot(commands.Cog):
             await interaction.response.send_message("Nothing to skip!")
             return
             
+        self.get_player(interaction.guild.id).skipped = True
         interaction.guild.voice_client.stop()
+        self.prefetcher.schedule(interaction.guild.id)
         await interaction.response.send_message("⏭️ Skipped current song")
 
     @app_commands.command(name="stop", description="Stop playback and clear the queue")
     async def stop(self, interaction: discord.Interaction):
         if interaction.guild.voice_client:
             self.get_queue(interaction.guild.id).clear()
+            self.prefetcher.cancel(interaction.guild.id)
+            if interaction.guild.voice_client.is_playing() or interaction.guild.voice_client.is_paused():
+                self.get_player(interaction.guild.id).skipped = True
             interaction.guild.voice_client.stop()
             await interaction.response.send_message("⏹️ Playback stopped and queue cleared")
         else:
             await interaction.response.send_message("Nothing is playing!")
 
     @app_commands.command(name="queue", description="Show the current queue")
-    async def queue(self, interaction: discord.Interaction):
+    @app_commands.describe(page="Page of the queue to show")
+    async def queue(self, interaction: discord.Interaction, page: int = 1):
         queue = self.get_queue(interaction.guild.id)
-        if not queue.queue:
+        if not queue:
             await interaction.response.send_message("Queue is empty!")
             return
+
+        pages = (len(queue) + QUEUE_PAGE_SIZE - 1) // QUEUE_PAGE_SIZE
+        if not 1 <= page <= pages:
+            await interaction.response.send_message(f"Invalid page! The queue has {pages} page(s).")
+            return
             
         embed = discord.Embed(title="Current Queue", color=discord.Color.blue())
         
-        for i, song in enumerate(queue.queue, 1):
+        start = (page - 1) * QUEUE_PAGE_SIZE
+        for i, song in enumerate(queue.slice(start, start + QUEUE_PAGE_SIZE), start + 1):
             duration = str(timedelta(seconds=song.duration))
             embed.add_field(
                 name=f"{i}. {song.title}",
-                value=f"Duration: {duration} | Requested by: {song.requester.display_name}",
+                value=f"Duration: {duration} | Requested by: {song.requester}",
                 inline=False
             )
-            if i >= 10:  # Show only first 10 songs
-                remaining = len(queue.queue) - 10
-                if remaining > 0:
-                    embed.add_field(name="...", value=f"And {remaining} more songs", inline=False)
-                break
+        embed.set_footer(text=f"Page {page}/{pages} | {len(queue)} songs")
                 
         await interaction.response.send_message(embed=embed)
 
@@ -353,11 +1615,12 @@ class MusicBot(commands.Cog):
     @app_commands.describe(index="Position of the song in the queue (1-based)")
     async def remove(self, interaction: discord.Interaction, index: int):
         queue = self.get_queue(interaction.guild.id)
-        if index < 1 or index > len(queue.queue):
+        if index < 1 or index > len(queue):
             await interaction.response.send_message("Invalid queue position!")
             return
             
         removed_song = queue.remove(index - 1)
+        self.prefetcher.schedule(interaction.guild.id)
         if removed_song:
             await interaction.response.send_message(f"🗑️ Removed from queue: {removed_song.title}")
         else:
@@ -368,25 +1631,69 @@ class MusicBot(commands.Cog):
         if interaction.guild.voice_client:
             await interaction.guild.voice_client.disconnect()
             self.get_queue(interaction.guild.id).clear()
+            self.journal.forget(interaction.guild.id)
+            self.prefetcher.cancel(interaction.guild.id)
+            self.extractor.cancel_guild(interaction.guild.id)
             await interaction.response.send_message("👋 Disconnected from voice")
         else:
             await interaction.response.send_message("Not in a voice channel!")
 
-    @app_commands.command(name="nowplaying", description="Show information about the current song")
+    @app_commands.command(name="autodisconnect", description="Set when the bot leaves an idle or empty voice channel")
+    @app_commands.describe(
+        idle="Minutes connected with nothing playing (0 = never)",
+        alone="Minutes alone in the voice channel (0 = never)"
+    )
+    async def autodisconnect(self, interaction: discord.Interaction, idle: int = None, alone: int = None):
+        idle_timeout, alone_timeout = self.disconnect_timeouts.get(
+            interaction.guild.id, (IDLE_DISCONNECT_TIMEOUT, ALONE_DISCONNECT_TIMEOUT)
+        )
+        if idle is not None or alone is not None:
+            if not interaction.user.guild_permissions.manage_guild:
+                await interaction.response.send_message("❌ You need the Manage Server permission to change this!")
+                return
+            if any(value is not None and not 0 <= value <= MAX_DISCONNECT_MINUTES for value in (idle, alone)):
+                await interaction.response.send_message(f"Timeouts must be between 0 and {MAX_DISCONNECT_MINUTES} minutes!")
+                return
+            if idle is not None:
+                idle_timeout = idle * 60
+            if alone is not None:
+                alone_timeout = alone * 60
+            self.disconnect_timeouts[interaction.guild.id] = (idle_timeout, alone_timeout)
+            self.update_idle_timer(interaction.guild, activity=True)
+
+        def describe(seconds):
+            return f"after {seconds // 60} min" if seconds >= 60 else (f"after {seconds} s" if seconds else "never")
+        await interaction.response.send_message(
+            f"⏲️ Leaving voice when idle: {describe(idle_timeout)} • when alone: {describe(alone_timeout)}"
+        )
+
+    @app_commands.command(name="nowplaying",description="Show information about the current song")
     async def nowplaying(self, interaction: discord.Interaction):
-        if not interaction.guild.voice_client or not interaction.guild.voice_client.is_playing():
+        voice_client = interaction.guild.voice_client
+        if not voice_client or not (voice_client.is_playing() or voice_client.is_paused()):
             await interaction.response.send_message("Nothing is playing right now!")
             return
             
-        song = self.now_playing.get(interaction.guild.id)
+        song = self.get_player(interaction.guild.id).now_playing
         if not song:
             await interaction.response.send_message("Cannot get current song info!")
             return
             
         embed = discord.Embed(title="Now Playing", color=discord.Color.blue())
         embed.add_field(name="Title", value=song.title)
-        embed.add_field(name="Requested by", value=song.requester.display_name)
+        embed.add_field(name="Requested by", value=song.requester)
         embed.add_field(name="Duration", value=str(timedelta(seconds=song.duration)))
+        position = int(self.position(interaction.guild.id))
+        if song.duration:
+            position = min(position, int(song.duration))
+            remaining = str(timedelta(seconds=int(song.duration) - position))
+            embed.add_field(
+                name="Position",
+                value=f"{timedelta(seconds=position)} / {timedelta(seconds=int(song.duration))} ({remaining} left)",
+                inline=False
+            )
+        else:
+            embed.add_field(name="Position", value=str(timedelta(seconds=position)), inline=False)
         if song.thumbnail:
             embed.set_thumbnail(url=song.thumbnail)
             
@@ -399,12 +1706,55 @@ class MusicBot(commands.Cog):
             return
             
         if interaction.guild.voice_client:
-            self.volumes[interaction.guild.id] = volume / 100
-            interaction.guild.voice_client.source.volume = volume / 100
-            await interaction.response.send_message(f"🔊 Volume set to {volume}%")
+            self.get_player(interaction.guild.id).volume = volume / 100
+            await interaction.response.defer()
+            try:
+                await self.apply_filters(interaction.guild)
+                await interaction.followup.send(f"🔊 Volume set to {volume}%")
+            except Exception as e:
+                logging.error(f"Error applying volume: {e}")
+                await interaction.followup.send(f"❌ Failed to apply volume: {e}")
         else:
             await interaction.response.send_message("Not currently playing!")
 
+    @app_commands.command(name="filters", description="Set audio filters (normalize, bass boost, speed)")
+    @app_commands.describe(
+        normalize="Even out loudness between tracks",
+        bass_boost=f"Bass boost in dB (0-{MAX_BASS_BOOST})",
+        speed=f"Playback speed ({MIN_SPEED}-{MAX_SPEED})"
+    )
+    async def filters_command(self, interaction: discord.Interaction, normalize: bool = None,
+                              bass_boost: int = None, speed: float = None):
+        if bass_boost is not None and not 0 <= bass_boost <= MAX_BASS_BOOST:
+            await interaction.response.send_message(f"Bass boost must be between 0 and {MAX_BASS_BOOST}!")
+            return
+        if speed is not None and not MIN_SPEED <= speed <= MAX_SPEED:
+            await interaction.response.send_message(f"Speed must be between {MIN_SPEED} and {MAX_SPEED}!")
+            return
+
+        filters = self.get_filters(interaction.guild.id)
+        if normalize is None and bass_boost is None and speed is None:
+            await interaction.response.send_message(f"🎛️ Active filters: {filters.describe()}")
+            return
+
+        if normalize is not None:
+            filters.normalize = normalize
+        if bass_boost is not None:
+            filters.bass_boost = bass_boost
+        if speed is not None:
+            filters.speed = round(speed, 2)
+
+        await interaction.response.defer()
+        try:
+            now_playing = self.get_player(interaction.guild.id).now_playing
+            if now_playing:
+                await self.prepare_filters(interaction.guild.id, now_playing)
+            await self.apply_filters(interaction.guild)
+            await interaction.followup.send(f"🎛️ Active filters: {filters.describe()}")
+        except Exception as e:
+            logging.error(f"Error applying filters: {e}")
+            await interaction.followup.send(f"❌ Failed to apply filters: {e}")
+
     @app_commands.command(name="loop", description="Set loop mode (off/single/queue)")
     @app_commands.choices(mode=[
         app_commands.Choice(name="Off", value=0),
@@ -412,7 +1762,8 @@ class MusicBot(commands.Cog):
         app_commands.Choice(name="Queue", value=2)
     ])
     async def loop(self, interaction: discord.Interaction, mode: int):
-        self.loop_mode[interaction.guild.id] = mode
+        self.get_player(interaction.guild.id).loop_mode = mode
+        self.prefetcher.schedule(interaction.guild.id)
         modes = ["disabled", "single track", "queue"]
         await interaction.response.send_message(f"🔄 Loop mode: {modes[mode]}")
 
@@ -420,6 +1771,7 @@ class MusicBot(commands.Cog):
     async def shuffle(self, interaction: discord.Interaction):
         queue = self.get_queue(interaction.guild.id)
         queue.shuffle()
+        self.prefetcher.schedule(interaction.guild.id)
         await interaction.response.send_message("🔀 Queue shuffled!")
 
     @app_commands.command(name="history", description="Show recently played songs")
@@ -433,7 +1785,7 @@ class MusicBot(commands.Cog):
         for i, song in enumerate(reversed(queue.history), 1):
             embed.add_field(
                 name=f"{i}. {song.title}",
-                value=f"Requested by {song.requester.display_name}",
+                value=f"Requested by {song.requester}",
                 inline=False
             )
             if i >= 10:  # Show only last 10 songs
@@ -443,25 +1795,31 @@ class MusicBot(commands.Cog):
 
     @app_commands.command(name="seek", description="Seek to a specific position (in seconds)")
     async def seek(self, interaction: discord.Interaction, position: int):
-        if not interaction.guild.voice_client or not interaction.guild.voice_client.is_playing():
+        voice_client = interaction.guild.voice_client
+        if not voice_client or not (voice_client.is_playing() or voice_client.is_paused()):
             await interaction.response.send_message("Nothing is playing right now!")
             return
             
-        song = self.now_playing.get(interaction.guild.id)
-        if not song or position >= song.duration:
+        song = self.get_player(interaction.guild.id).now_playing
+        if not song or position < 0 or position >= song.duration:
             await interaction.response.send_message("Invalid position!")
             return
             
-        # Implementation would require modifying the FFmpeg options
-        await interaction.response.send_message(f"⏩ Seeking to {position} seconds")
+        await interaction.response.defer()
+        try:
+            await self.restart_source(interaction.guild, position)
+            await interaction.followup.send(f"⏩ Seeking to {timedelta(seconds=position)}")
+        except Exception as e:
+            logging.error(f"Error seeking: {e}")
+            await interaction.followup.send(f"❌ Failed to seek: {e}")
 
     @app_commands.command(name="lyrics", description="Get lyrics for the current song")
     async def lyrics(self, interaction: discord.Interaction):
-        if not self.now_playing.get(interaction.guild.id):
+        song = self.get_player(interaction.guild.id).now_playing
+        if not song:
             await interaction.response.send_message("Nothing is playing right now!")
             return
             
-        song = self.now_playing[interaction.guild.id]
         # Here you would implement lyrics fetching from a service like Genius
         await interaction.response.send_message(f"🎵 Searching lyrics for: {song.title}...")
 
@@ -469,6 +1827,7 @@ class MusicBot(commands.Cog):
     async def clear(self, interaction: discord.Interaction):
         queue = self.get_queue(interaction.guild.id)
         queue.clear()
+        self.prefetcher.schedule(interaction.guild.id)
         await interaction.response.send_message("🗑️ Queue cleared!")
 
     @app_commands.command(name="move", description="Move a song to a different position in the queue")
@@ -478,16 +1837,239 @@ class MusicBot(commands.Cog):
     )
     async def move(self, interaction: discord.Interaction, from_pos: int, to_pos: int):
         queue = self.get_queue(interaction.guild.id)
-        if not 1 <= from_pos <= len(queue.queue) or not 1 <= to_pos <= len(queue.queue):
+        if not 1 <= from_pos <= len(queue) or not 1 <= to_pos <= len(queue):
             await interaction.response.send_message("❌ Invalid position!")
             return
             
-        queue_list = list(queue.queue)
-        song = queue_list.pop(from_pos - 1)
-        queue_list.insert(to_pos - 1, song)
-        queue.queue = deque(queue_list, maxlen=MAX_QUEUE_SIZE)
+        song = queue.move(from_pos - 1, to_pos - 1)
+        self.prefetcher.schedule(interaction.guild.id)
         await interaction.response.send_message(f"✅ Moved {song.title} to position {to_pos}")
 
+    playlist = app_commands.Group(name="playlist", description="Manage saved playlists")
+
+    @playlist.command(name="create", description="Create a new playlist")
+    @app_commands.describe(name="Name of the playlist")
+    async def playlist_create(self, interaction: discord.Interaction, name: str):
+        try:
+            await self.playlists.create(interaction.guild.id, name, interaction.user.id)
+        except PlaylistError as e:
+            await interaction.response.send_message(f"❌ {e}")
+            return
+        await interaction.response.send_message(f"📑 Created playlist {name}")
+
+    @playlist.command(name="add", description="Add a song, or everything a playlist or album URL lists, to a playlist")
+    @app_commands.describe(name="Name of the playlist", song="URL or search term")
+    async def playlist_add(self, interaction: discord.Interaction, name: str, song: str):
+        try:
+            await self.check_playlist_owner(interaction, name)
+        except PlaylistError as e:
+            await interaction.response.send_message(f"❌ {e}")
+            return
+
+        await interaction.response.defer()
+        task = asyncio.create_task(self.save_to_playlist(interaction.guild.id, name, song))
+        done, _ = await asyncio.wait((task,), timeout=PLAYLIST_ADD_WAIT)
+        if done:
+            await interaction.followup.send(task.result())
+            return
+        # Listing a large playlist can take a while; finish the import without holding the command
+        await interaction.followup.send(f"📥 Importing into {name} in the background...")
+        reply = asyncio.create_task(self.post_when_done(task, interaction.channel))
+        self.playlist_imports.add(reply)
+        reply.add_done_callback(self.playlist_imports.discard)
+
+    async def save_to_playlist(self, guild_id, name, query):
+        """Save what a query finds to a playlist and return the reply for the user.
+
+        A URL that lists several entries (a playlist, channel or album) is
+        imported whole; a search or a single video adds one track.
+        """
+        try:
+            # A lane of its own: leaving voice cancels the guild's extractions, not its playlist edits
+            data = await self.metadata.extract(
+                query,
+                partial(self.extract_info, guild_id=('playlists', guild_id), flat=True),
+                min_ttl=URL_REFRESH_MARGIN,
+                flat=True
+            )
+            listed = 'entries' in data and query.strip().startswith(('http://', 'https://'))
+            entries = [entry for entry in data.get('entries', [data]) if entry and track_url(entry)]
+            if not entries:
+                return "❌ Nothing playable was found"
+            if not listed:
+                entries = entries[:1]
+            added = await self.playlists.add_tracks(guild_id, name, entries)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            return f"❌ Adding to {name} was cancelled, please try again"
+        except Exception as e:
+            logging.error(f"Error adding to playlist {name}: {e}", extra={'guild_id': guild_id})
+            return f"❌ Failed to add to {name}: {str(e)}"
+
+        if not listed:
+            if added:
+                return f"📑 Added {entries[0].get('title', 'Unknown')} to {name}"
+            return f"❌ {name} is full ({PLAYLIST_MAX_TRACKS} songs)"
+        if added < len(entries):
+            return f"📑 Imported {added} of {len(entries)} songs into {name} (playlist is full)"
+        return f"📑 Imported {added} songs into {name}"
+
+    async def post_when_done(self, task, channel):
+        reply = await task
+        try:
+            await channel.send(reply)
+        except discord.HTTPException as e:
+            logging.error(f"Failed to post playlist import result: {e}")
+
+    async def check_playlist_owner(self, interaction, name):
+        """Only a playlist's creator or server managers may change it."""
+        _, owner_id, _, _ = await self.playlists.get(interaction.guild.id, name)
+        if owner_id != interaction.user.id and not interaction.user.guild_permissions.manage_guild:
+            raise PlaylistError(f"Only the creator of {name} can change it")
+
+    @playlist.command(name="load", description="Load and play a playlist")
+    @app_commands.describe(name="Name of the playlist")
+    async def playlist_load(self, interaction: discord.Interaction, name: str):
+        if not interaction.user.voice:
+            await interaction.response.send_message("❌ You must be in a voice channel!")
+            return
+        try:
+            playlist_id, _, track_count, _ = await self.playlists.get(interaction.guild.id, name)
+        except PlaylistError as e:
+            await interaction.response.send_message(f"❌ {e}")
+            return
+        if not track_count:
+            await interaction.response.send_message(f"{name} is empty!")
+            return
+
+        await interaction.response.defer()
+        try:
+            if not interaction.guild.voice_client:
+                await self.create_voice_client(interaction.user.voice.channel)
+            self.get_player(interaction.guild.id).retry_count = 0
+
+            queue = self.get_queue(interaction.guild.id)
+            message = await interaction.followup.send(f"📑 Loading {track_count} songs from {name}...", wait=True)
+            # Songs are queued from their saved metadata; stream URLs are resolved as they come up
+            added = 0
+            for offset in range(0, track_count, PLAYLIST_LOAD_PAGE):
+                entries = await self.playlists.tracks(playlist_id, offset, PLAYLIST_LOAD_PAGE)
+                page_added = queue.add_many([Song(entry, interaction.user.id) for entry in entries])
+                added += page_added
+                if offset == 0 and added:
+                    await self.start_or_prefetch(interaction.guild)
+                if page_added < len(entries):
+                    break
+                if added < track_count:
+                    await message.edit(content=f"📑 Loading songs from {name}... {added}/{track_count}")
+            self.prefetcher.schedule(interaction.guild.id)
+            if added < track_count:
+                await message.edit(content=f"📑 Loaded {added} of {track_count} songs from {name} (queue is full)")
+            else:
+                await message.edit(content=f"📑 Loaded {added} songs from {name}")
+        except Exception as e:
+            logging.error(f"Error loading playlist: {str(e)}")
+            await interaction.followup.send(f"❌ An error occurred: {str(e)}")
+
+    @playlist.command(name="list", description="Show all saved playlists")
+    async def playlist_list(self, interaction: discord.Interaction):
+        playlists = await self.playlists.list(interaction.guild.id)
+        if not playlists:
+            await interaction.response.send_message("No saved playlists!")
+            return
+
+        embed = discord.Embed(title="Saved Playlists", color=discord.Color.blue())
+        for name, owner_id, track_count, total_duration in playlists:
+            owner = interaction.guild.get_member(owner_id)
+            embed.add_field(
+                name=name,
+                value=f"{track_count} songs • {str(timedelta(seconds=total_duration))} • "
+                      f"by {owner.display_name if owner else 'Unknown'}",
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed)
+
+    @playlist.command(name="delete", description="Delete a playlist")
+    @app_commands.describe(name="Name of the playlist")
+    async def playlist_delete(self, interaction: discord.Interaction, name: str):
+        try:
+            await self.check_playlist_owner(interaction, name)
+            await self.playlists.delete(interaction.guild.id, name)
+        except PlaylistError as e:
+            await interaction.response.send_message(f"❌ {e}")
+            return
+        await interaction.response.send_message(f"🗑️ Deleted playlist {name}")
+
+    @app_commands.command(name="stats", description="Show bot statistics")
+    async def stats_command(self, interaction: discord.Interaction):
+        plays, skips, seconds = await self.stats.guild_totals()
+        peak = await self.stats.peak_hour()
+        uptime = timedelta(seconds=int(time.time() - self.stats.started_at))
+
+        embed = discord.Embed(title="Bot Statistics", color=discord.Color.blue())
+        embed.add_field(name="Servers", value=str(len(self.bot.guilds)))
+        if interaction.guild.shard_id is not None and self.bot.shard_count:
+            embed.add_field(name="Shard", value=f"{interaction.guild.shard_id + 1}/{self.bot.shard_count}")
+        embed.add_field(name="Playing in", value=f"{len(self.bot.voice_clients)} voice channels")
+        if self.players:
+            memory = sum(player.estimated_size() for player in self.players.values())
+            embed.add_field(
+                name="Player memory",
+                value=f"{memory // 1024} KiB for {len(self.players)} servers "
+                      f"({memory // len(self.players) // 1024} KiB each)"
+            )
+            player = self.players.get(interaction.guild.id)
+            if player:
+                embed.add_field(name="This server's player", value=f"{player.estimated_size() // 1024} KiB")
+        embed.add_field(name="Uptime", value=str(uptime))
+        embed.add_field(name="Songs played", value=str(plays))
+        embed.add_field(name="Songs skipped", value=str(skips))
+        embed.add_field(name="Listening time", value=format_hours(seconds))
+        if peak:
+            embed.add_field(name="Peak hour", value=f"{peak[0]:02d}:00 ({peak[1]} plays)")
+        await interaction.response.send_message(embed=embed)
+
+    @app_commands.command(name="mystats", description="Show your listening statistics")
+    async def mystats(self, interaction: discord.Interaction):
+        plays, skips, seconds = await self.stats.user_totals(interaction.guild.id, interaction.user.id)
+        embed = discord.Embed(
+            title=f"Listening stats for {interaction.user.display_name}",
+            color=discord.Color.blue()
+        )
+        embed.add_field(name="Songs requested", value=str(plays))
+        embed.add_field(name="Songs skipped", value=str(skips))
+        embed.add_field(name="Listening time", value=format_hours(seconds))
+        await interaction.response.send_message(embed=embed)
+
+    @app_commands.command(name="topplayed", description="Show the most played songs")
+    async def topplayed(self, interaction: discord.Interaction):
+        await self.send_leaderboard(interaction, "Most Played Songs", await self.stats.top_tracks(limit=LEADERBOARD_SIZE))
+
+    @app_commands.command(name="servertop", description="Show this server's top tracks")
+    async def servertop(self, interaction: discord.Interaction):
+        tracks = await self.stats.top_tracks(interaction.guild.id, LEADERBOARD_SIZE)
+        await self.send_leaderboard(interaction, f"Top Tracks in {interaction.guild.name}", tracks)
+
+    async def send_leaderboard(self, interaction, title, tracks):
+        if not tracks:
+            await interaction.response.send_message("No songs have been played yet!")
+            return
+        embed = discord.Embed(title=title, color=discord.Color.blue())
+        for i, (video_id, track_title, plays, seconds) in enumerate(tracks, 1):
+            embed.add_field(
+                name=f"{i}. {track_title}",
+                value=f"{plays} plays • {format_hours(seconds)} listened",
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed)
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        """Count every command as activity for the auto-disconnect timer."""
+        if interaction.guild:
+            self.update_idle_timer(interaction.guild, activity=True)
+        return True
+
     async def cog_before_invoke(self, interaction: discord.Interaction):
         """Check if the bot has required permissions before executing commands."""
         if not interaction.guild:
@@ -501,36 +2083,82 @@ class MusicBot(commands.Cog):
             
         return True
 
-    def cog_unload(self):
+    async def cog_unload(self):
         """Cleanup when the cog is unloaded."""
+        # Save where every guild is before disconnecting, so a restart can resume them
         for voice_client in self.bot.voice_clients:
-            asyncio.create_task(voice_client.disconnect())
-        asyncio.create_task(self.session.close())
+            self.save_player_state(voice_client.guild)
+        self.closing = True
+        if self.state_task:
+            self.state_task.cancel()
+        if self.evict_task:
+            self.evict_task.cancel()
+        self.refresher.stop()
+        self.idle_timers.stop()
+        self.prefetcher.cancel_all()
+        self.loudness.cancel_all()
+        self.audio_cache.cancel_all()
+        self.extractor.shutdown()
+        for voice_client in self.bot.voice_clients:
+            await voice_client.disconnect(force=True)
+        await self.journal.close()
+        await self.stats.close()
+        for task in self.playlist_imports:
+            task.cancel()
+        await self.playlists.close()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        await self.session.close()
+        await self.metadata.close()
 
 @bot.event
 async def on_ready():
     """Called when the bot is ready and connected to Discord."""
     logging.info(f'{bot.user} has connected to Discord!')
-    try:
-        synced = await bot.tree.sync()
-        logging.info(f"Synced {len(synced)} command(s)")
-    except Exception as e:
-        logging.error(f"Failed to sync commands: {e}")
+    # Commands are global, so one process of a cluster syncing them is enough
+    if CLUSTER_ID in (None, '0'):
+        try:
+            synced = await bot.tree.sync()
+            logging.info(f"Synced {len(synced)} command(s)")
+        except Exception as e:
+            logging.error(f"Failed to sync commands: {e}")
+
+    cog = bot.get_cog('MusicBot')
+    if cog and RESTORE_ON_STARTUP:
+        await cog.restore_players()
         
 @bot.event
 async def on_voice_state_update(member, before, after):
     """Enhanced voice state update handler with better cleanup"""
+    cog = bot.get_cog('MusicBot')
+    if cog is None or cog.closing:
+        return
     if member.id == bot.user.id and after.channel is None:  # Bot was disconnected
         guild = member.guild
-        if guild.id in bot.get_cog('MusicBot').queues:
-            bot.get_cog('MusicBot').queues[guild.id].clear()
-        if guild.id in bot.get_cog('MusicBot').now_playing:
-            del bot.get_cog('MusicBot').now_playing[guild.id]
-    elif member.guild.voice_client and len(member.guild.voice_client.channel.members) == 1:
-        await asyncio.sleep(60)  # Wait 60 seconds before disconnecting if alone
-        if member.guild.voice_client and len(member.guild.voice_client.channel.members) == 1:
-            await member.guild.voice_client.disconnect()
-        
+        if guild.id in cog.idle_disconnects:
+            # Left by the idle timer, which keeps the queue for the next /play
+            cog.idle_disconnects.discard(guild.id)
+        else:
+            if guild.id in cog.players:
+                cog.players[guild.id].reset()
+            cog.journal.forget(guild.id)
+        cog.prefetcher.cancel(guild.id)
+        cog.extractor.cancel_guild(guild.id)
+        cog.idle_timers.cancel(guild.id)
+    elif member.guild.voice_client:
+        # Someone joined or left the bot's channel, or the bot itself moved
+        channel = member.guild.voice_client.channel
+        if member.id == bot.user.id or channel in (before.channel, after.channel):
+            cog.update_idle_timer(member.guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    """Drop pending work for a guild the bot was removed from."""
+    cog = bot.get_cog('MusicBot')
+    if cog:
+        cog.prefetcher.cancel(guild.id)
+        cog.extractor.cancel_guild(guild.id)
+
 @bot.event
 async def on_command_error(ctx, error):
     """Global error handler for command errors."""
@@ -546,6 +2174,8 @@ async def setup():
     """Initialize the bot and add the MusicBot cog."""
     await bot.add_cog(MusicBot(bot))
 
+# Runs inside bot.run's event loop, so the cog's background tasks live on the right loop
+bot.setup_hook = setup
+
 if __name__ == "__main__":
-    asyncio.run(setup())
     bot.run(TOKEN)
@@ -0,0 +1,189 @@
+import logging
+import threading
+
+import discord
+
+FRAME_SECONDS = 0.02  # Discord sends one 20 ms Opus frame per packet
+
+class Broadcast:
+    """One ffmpeg source whose Opus packets are read by any number of guilds.
+
+    A producer thread reads packets into a ring buffer of ``capacity`` slots.
+    Every reader keeps its own position and is handed the buffered ``bytes``
+    objects themselves, so a listener costs neither a process nor a copy. The
+    producer stays at most ``lead`` packets ahead of the furthest reader, the
+    way a guild's own ffmpeg blocks on its pipe.
+    """
+
+    def __init__(self, key, source, capacity, lead, live):
+        self.key = key
+        self.source = source
+        self.capacity = capacity
+        self.lead = lead
+        self.live = live
+        self.ring = [None] * capacity
+        self.head = 0  # Packets written so far; packet n is in slot n % capacity
+        self.finished = False
+        self.closed = False
+        self.readers = set()
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._produce, name=f"broadcast-{key[0]}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def join(self, reader):
+        """Attach a reader; on-demand tracks are only joined while their beginning is still buffered.
+
+        Live streams are joined at the newest packet.
+        """
+        with self.condition:
+            if self.closed or self.finished:
+                return False
+            if self.live:
+                reader.position = self.head
+            elif self.readers and self._furthest() + self.lead > self.capacity:
+                # The first packets would be overwritten before this reader got to them
+                return False
+            else:
+                reader.position = 0
+            self.readers.add(reader)
+            return True
+
+    def leave(self, reader):
+        """Detach a reader; returns True when it was the last one and the broadcast stopped."""
+        with self.condition:
+            self.readers.discard(reader)
+            if self.readers:
+                self.condition.notify_all()
+                return False
+            self.closed = True
+            self.condition.notify_all()
+            return True
+
+    def read(self, reader):
+        """Return the next packet for ``reader``, or None once it fell out of the buffer."""
+        with self.condition:
+            while reader.position >= self.head and not self.finished and not self.closed:
+                self.condition.wait()
+            if reader.position >= self.head:
+                return b''
+            oldest = self.head - self.capacity
+            if reader.position < oldest:
+                if not self.live:
+                    return None
+                reader.position = oldest
+            packet = self.ring[reader.position % self.capacity]
+            reader.position += 1
+            self.condition.notify_all()
+            return packet
+
+    def _furthest(self):
+        return max((reader.position for reader in self.readers), default=self.head)
+
+    def _produce(self):
+        try:
+            while True:
+                with self.condition:
+                    while not self.closed and self.head - self._furthest() >= self.lead:
+                        self.condition.wait()
+                    if self.closed:
+                        break
+                packet = self.source.read()
+                if not packet:
+                    break
+                with self.condition:
+                    self.ring[self.head % self.capacity] = packet
+                    self.head += 1
+                    self.condition.notify_all()
+        except Exception as e:
+            logging.error(f"Broadcast of {self.key[0]} failed: {e}")
+        finally:
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+            self.source.cleanup()
+
+class BroadcastSource(discord.AudioSource):
+    """A guild's view of a broadcast.
+
+    A reader of an on-demand track that falls out of the buffer, e.g. after
+    being paused for longer than it holds, continues on its own ffmpeg process
+    from where it was.
+    """
+
+    def __init__(self, hub, broadcast, spawn):
+        self.hub = hub
+        self.broadcast = broadcast
+        self.spawn = spawn
+        self.position = 0
+        self.fallback = None
+
+    def read(self):
+        if self.fallback is not None:
+            return self.fallback.read()
+        packet = self.broadcast.read(self)
+        if packet is not None:
+            return packet
+        logging.info(f"Listener fell behind the broadcast of {self.broadcast.key[0]}, starting its own source")
+        self.hub.leave(self.broadcast, self)
+        self.fallback = self.spawn(self.position * FRAME_SECONDS)
+        return self.fallback.read()
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        if self.fallback is not None:
+            self.fallback.cleanup()
+            self.fallback = None
+        elif self.broadcast is not None:
+            self.hub.leave(self.broadcast, self)
+        self.broadcast = None
+
+class BroadcastHub:
+    """Shares one ffmpeg process between all guilds playing the same source with the same settings.
+
+    ``spawn(position)`` creates the ffmpeg source for a broadcast; it is also
+    used for listeners that can't join the running one.
+    """
+
+    def __init__(self, buffer_seconds=30, lead_seconds=5):
+        self.capacity = int(buffer_seconds / FRAME_SECONDS)
+        self.lead = int(lead_seconds / FRAME_SECONDS)
+        self.broadcasts = {}
+        self.lock = threading.Lock()
+        self.joined = 0
+
+    def __len__(self):
+        return len(self.broadcasts)
+
+    def listeners(self):
+        with self.lock:
+            return sum(len(broadcast.readers) for broadcast in self.broadcasts.values())
+
+    def subscribe(self, key, spawn, live=False):
+        """Return an audio source reading the broadcast for ``key``, starting one if needed."""
+        with self.lock:
+            broadcast = self.broadcasts.get(key)
+            if broadcast is not None:
+                reader = BroadcastSource(self, broadcast, spawn)
+                if broadcast.join(reader):
+                    self.joined += 1
+                    return reader
+                if not (broadcast.finished or broadcast.closed):
+                    # An on-demand track too far along to join from the start
+                    return spawn(0)
+
+            broadcast = Broadcast(key, spawn(0), self.capacity, self.lead, live)
+            reader = BroadcastSource(self, broadcast, spawn)
+            broadcast.join(reader)
+            self.broadcasts[key] = broadcast
+        broadcast.start()
+        return reader
+
+    def leave(self, broadcast, reader):
+        if broadcast.leave(reader):
+            with self.lock:
+                if self.broadcasts.get(broadcast.key) is broadcast:
+                    del self.broadcasts[broadcast.key]
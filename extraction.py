@@ -0,0 +1,181 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import yt_dlp
+
+PRIORITY_PLAY_NOW = 0  # A user is waiting on this result
+PRIORITY_BACKGROUND = 1  # Prefetching and playlist entries resolved ahead of time
+
+# Every worker thread (or process) gets its own YoutubeDL instances
+_worker = threading.local()
+
+def _init_worker(options, flat_options):
+    _worker.full = yt_dlp.YoutubeDL(options)
+    _worker.flat = yt_dlp.YoutubeDL(flat_options)
+
+def _extract(query, flat):
+    ydl = _worker.flat if flat else _worker.full
+    return ydl.extract_info(query, download=False)
+
+class ExtractionJob:
+    def __init__(self, query, guild_id, flat, priority, future):
+        self.query = query
+        self.guild_id = guild_id
+        self.flat = flat
+        self.priority = priority
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+class ExtractionScheduler:
+    """Runs yt-dlp extractions on a dedicated worker pool.
+
+    Pending jobs wait in one lane per priority and are handed out round-robin
+    across guilds, so a guild queueing a large playlist can't starve the others.
+    A guild never has more than ``guild_limit`` extractions running at once, and
+    jobs are only submitted when a worker is free so the pool's own FIFO never
+    reorders them.
+    """
+
+    def __init__(self, options, flat_options, workers=4, guild_limit=2, mode='thread'):
+        self.workers = workers
+        self.guild_limit = guild_limit
+        pool = ProcessPoolExecutor if mode == 'process' else ThreadPoolExecutor
+        self.executor = pool(max_workers=workers, initializer=_init_worker, initargs=(options, flat_options))
+        self.lanes = {PRIORITY_PLAY_NOW: OrderedDict(), PRIORITY_BACKGROUND: OrderedDict()}
+        self.running = {}
+        self.in_progress = set()
+        self.active = 0
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def extract(self, query, guild_id=None, flat=False, priority=PRIORITY_PLAY_NOW):
+        """Queue an extraction and wait for its result."""
+        job = ExtractionJob(query, guild_id, flat, priority, asyncio.get_event_loop().create_future())
+        self.lanes[priority].setdefault(guild_id, deque()).append(job)
+        self.submitted += 1
+        self._dispatch()
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            self._drop(job)
+            raise
+
+    def cancel_guild(self, guild_id):
+        """Cancel everything a guild is still waiting on, e.g. when it leaves voice.
+
+        Extractions already running can't be interrupted; their results are discarded.
+        """
+        for lane in self.lanes.values():
+            for job in lane.pop(guild_id, ()):
+                if not job.future.done():
+                    job.future.cancel()
+                    self.cancelled += 1
+        for job in self.in_progress:
+            if job.guild_id == guild_id and not job.future.done():
+                job.future.cancel()
+
+    def promote(self, query, guild_id=None):
+        """Move a guild's pending background extraction of ``query`` to the play-now lane."""
+        background = self.lanes[PRIORITY_BACKGROUND]
+        jobs = background.get(guild_id)
+        if not jobs:
+            return
+        for job in [job for job in jobs if job.query == query]:
+            jobs.remove(job)
+            job.priority = PRIORITY_PLAY_NOW
+            self.lanes[PRIORITY_PLAY_NOW].setdefault(guild_id, deque()).append(job)
+        if not jobs:
+            del background[guild_id]
+
+    def queue_depth(self, priority=None):
+        lanes = [self.lanes[priority]] if priority is not None else self.lanes.values()
+        return sum(len(jobs) for lane in lanes for jobs in lane.values())
+
+    def stats(self):
+        started = self.started
+        return {
+            'workers': self.workers,
+            'active': self.active,
+            'queued_play_now': self.queue_depth(PRIORITY_PLAY_NOW),
+            'queued_background': self.queue_depth(PRIORITY_BACKGROUND),
+            'submitted': self.submitted,
+            'started': self.started,
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+            'wait_avg': self.wait_total / started if started else 0.0,
+            'wait_max': self.wait_max,
+        }
+
+    def shutdown(self):
+        for guild_id in {guild_id for lane in self.lanes.values() for guild_id in lane}:
+            self.cancel_guild(guild_id)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _next_job(self):
+        for lane in self.lanes.values():
+            for guild_id, jobs in lane.items():
+                if self.running.get(guild_id, 0) >= self.guild_limit:
+                    continue
+                job = jobs.popleft()
+                if jobs:
+                    lane.move_to_end(guild_id)
+                else:
+                    del lane[guild_id]
+                return job
+        return None
+
+    def _dispatch(self):
+        while self.active < self.workers:
+            job = self._next_job()
+            if job is None:
+                return
+            if job.future.done():
+                continue
+
+            wait = time.monotonic() - job.enqueued_at
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.started += 1
+            self.active += 1
+            self.running[job.guild_id] = self.running.get(job.guild_id, 0) + 1
+            self.in_progress.add(job)
+            running = asyncio.get_event_loop().run_in_executor(self.executor, _extract, job.query, job.flat)
+            running.add_done_callback(lambda result, job=job: self._finished(job, result))
+
+    def _finished(self, job, result):
+        self.active -= 1
+        self.in_progress.discard(job)
+        self.running[job.guild_id] -= 1
+        if not self.running[job.guild_id]:
+            del self.running[job.guild_id]
+
+        if result.cancelled():
+            self.cancelled += 1
+            if not job.future.done():
+                job.future.cancel()
+        elif result.exception() is not None:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(result.exception())
+        else:
+            self.completed += 1
+            if not job.future.done():
+                job.future.set_result(result.result())
+        self._dispatch()
+
+    def _drop(self, job):
+        jobs = self.lanes[job.priority].get(job.guild_id)
+        if jobs and job in jobs:
+            jobs.remove(job)
+            self.cancelled += 1
+            if not jobs:
+                del self.lanes[job.priority][job.guild_id]
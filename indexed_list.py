@@ -0,0 +1,160 @@
+import random
+
+class _Node:
+    __slots__ = ('item', 'priority', 'size', 'left', 'right')
+
+    def __init__(self, item, priority=None):
+        self.item = item
+        self.priority = random.random() if priority is None else priority
+        self.size = 1
+        self.left = None
+        self.right = None
+
+def _size(node):
+    return node.size if node else 0
+
+def _update(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+def _split(node, k):
+    """Split a subtree into its first ``k`` items and the rest."""
+    if node is None:
+        return None, None
+    if _size(node.left) < k:
+        left, right = _split(node.right, k - _size(node.left) - 1)
+        node.right = left
+        _update(node)
+        return node, right
+    left, right = _split(node.left, k)
+    node.left = right
+    _update(node)
+    return left, node
+
+def _merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+class IndexedList:
+    """Sequence backed by an implicit treap.
+
+    Indexing, insertion and removal at any position take O(log n).
+    """
+
+    def __init__(self, items=()):
+        self.root = None
+        self.extend(items)
+
+    def __len__(self):
+        return _size(self.root)
+
+    def __bool__(self):
+        return self.root is not None
+
+    def __iter__(self):
+        return self.slice(0, len(self))
+
+    def __getitem__(self, index):
+        return self._node_at(self._normalize(index)).item
+
+    def append(self, item):
+        return self.insert(len(self), item)
+
+    def extend(self, items):
+        """Append many items, building them into a balanced subtree in O(k)."""
+        nodes = [_Node(item) for item in items]
+        if nodes:
+            self.root = _merge(self.root, self._build(nodes))
+
+    def insert(self, index, item):
+        """Insert an item before ``index``."""
+        index = max(0, min(index, len(self)))
+        left, right = _split(self.root, index)
+        self.root = _merge(_merge(left, _Node(item)), right)
+
+    def pop(self, index=-1):
+        index = self._normalize(index)
+        left, rest = _split(self.root, index)
+        node, right = _split(rest, 1)
+        self.root = _merge(left, right)
+        return node.item
+
+    def slice(self, start, stop):
+        """Yield the items in ``[start, stop)`` in O(log n + k) without copying the list."""
+        start = max(0, start)
+        count = min(stop, len(self)) - start
+        stack = []
+        node = self.root
+        k = start
+        while node and count > 0:
+            left = _size(node.left)
+            if k < left:
+                stack.append(node)
+                node = node.left
+            elif k == left:
+                stack.append(node)
+                break
+            else:
+                k -= left + 1
+                node = node.right
+
+        while stack and count > 0:
+            node = stack.pop()
+            yield node.item
+            count -= 1
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+
+    def clear(self):
+        self.root = None
+
+    def _normalize(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("list index out of range")
+        return index
+
+    def _node_at(self, index):
+        node = self.root
+        while node:
+            left = _size(node.left)
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node
+            else:
+                index -= left + 1
+                node = node.right
+        raise IndexError("list index out of range")
+
+    @staticmethod
+    def _build(nodes):
+        """Build a balanced treap; priorities are handed out level by level to keep the heap order."""
+        def build(lo, hi, depth):
+            if lo >= hi:
+                return None
+            mid = (lo + hi) // 2
+            node = nodes[mid]
+            levels.append((depth, mid))
+            node.left = build(lo, mid, depth + 1)
+            node.right = build(mid + 1, hi, depth + 1)
+            _update(node)
+            return node
+
+        levels = []
+        root = build(0, len(nodes), 0)
+        priorities = sorted((random.random() for _ in nodes), reverse=True)
+        for priority, (_, index) in zip(priorities, sorted(levels)):
+            nodes[index].priority = priority
+        return root
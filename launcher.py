@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+
+import aiohttp
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    filename='launcher.log'
+)
+
+load_dotenv()
+TOKEN = os.getenv('DISCORD_TOKEN')
+CLUSTER_COUNT = int(os.getenv('CLUSTER_COUNT', '2'))
+SHARD_COUNT = os.getenv('SHARD_COUNT') or 'auto'
+CLUSTER_START_DELAY = 5  # Seconds between cluster starts, so shards don't all identify at once
+MAX_RESTART_DELAY = 60
+
+async def recommended_shards():
+    """Ask Discord how many shards the bot should run."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            'https://discord.com/api/v10/gateway/bot',
+            headers={'Authorization': f'Bot {TOKEN}'}
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())['shards']
+
+def shard_ranges(shard_count, cluster_count):
+    """Split shards into contiguous, near equal ranges, one per cluster."""
+    cluster_count = min(cluster_count, shard_count)
+    size, extra = divmod(shard_count, cluster_count)
+    ranges, first = [], 0
+    for cluster in range(cluster_count):
+        last = first + size + (cluster < extra)
+        ranges.append(range(first, last))
+        first = last
+    return ranges
+
+class Cluster:
+    """One bot process running a range of shards, restarted with backoff when it dies."""
+
+    def __init__(self, cluster_id, shard_ids, shard_count):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.process = None
+        self.stopping = False
+
+    async def run(self):
+        delay = 1
+        while not self.stopping:
+            env = {
+                **os.environ,
+                'CLUSTER_ID': str(self.cluster_id),
+                'SHARD_COUNT': str(self.shard_count),
+                'SHARD_IDS': f"{self.shard_ids.start}-{self.shard_ids.stop - 1}",
+            }
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py'), env=env
+            )
+            logging.info(
+                f"Cluster {self.cluster_id} started (pid {self.process.pid}, "
+                f"shards {self.shard_ids.start}-{self.shard_ids.stop - 1})"
+            )
+            started = asyncio.get_event_loop().time()
+            code = await self.process.wait()
+            if self.stopping:
+                break
+            # A process that ran for a while gets restarted right away, a crash loop backs off
+            if asyncio.get_event_loop().time() - started > MAX_RESTART_DELAY:
+                delay = 1
+            logging.error(f"Cluster {self.cluster_id} exited with code {code}, restarting in {delay}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RESTART_DELAY)
+
+    def stop(self):
+        self.stopping = True
+        if self.process and self.process.returncode is None:
+            # SIGINT makes bot.run close the bot cleanly, flushing the player journal and stats
+            self.process.send_signal(signal.SIGINT)
+
+async def main():
+    shard_count = await recommended_shards() if SHARD_COUNT == 'auto' else int(SHARD_COUNT)
+    clusters = [
+        Cluster(cluster_id, shard_ids, shard_count)
+        for cluster_id, shard_ids in enumerate(shard_ranges(shard_count, CLUSTER_COUNT))
+    ]
+    logging.info(f"Launching {len(clusters)} cluster(s) for {shard_count} shard(s)")
+
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: [cluster.stop() for cluster in clusters])
+
+    tasks = []
+    for cluster in clusters:
+        if cluster.stopping:
+            break
+        tasks.append(asyncio.create_task(cluster.run()))
+        await asyncio.sleep(CLUSTER_START_DELAY)
+    await asyncio.gather(*tasks)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed with ``extra=`` and is written as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any ``extra=`` fields (guild_id, song_id, timings) kept as keys."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+            'uptime_ms': round(record.relativeCreated),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class RateLimitFilter(logging.Filter):
+    """Lets each logging call site emit at most ``burst`` records per ``window`` seconds.
+
+    Call sites are told apart by file and line, so a retry loop logging a
+    different exception text every time is still one site. The first record
+    let through after a quiet period carries how many were dropped as
+    ``suppressed``.
+    """
+
+    def __init__(self, burst=5, window=10.0, level=logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.level = level
+        self.sites = {}  # (path, line) -> [window start, records let through, records dropped]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self.lock:
+            site = self.sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                if len(self.sites) > 10000:
+                    self.sites.clear()
+                dropped = site[2] if site else 0
+                self.sites[key] = [now, 1, 0]
+                if dropped:
+                    record.suppressed = dropped
+                return True
+            if site[1] < self.burst:
+                site[1] += 1
+                return True
+            site[2] += 1
+            return False
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that drops records instead of blocking when the writer thread falls behind."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def setup_logging(filename, level=logging.INFO, json_format=True, max_bytes=0, backups=5,
+                  when='', queue_size=10000, burst=5, window=10.0):
+    """Route the root logger through a queue to a file written by a background thread.
+
+    Logging calls only format the message and put it on the queue, so the event
+    loop and the player threads never wait on the disk. The file rotates at
+    ``max_bytes`` or, with ``when`` (e.g. ``'midnight'``), on a schedule.
+    The listener is stopped at exit. Returns the queue handler, whose
+    ``dropped`` counts records lost to a full queue.
+    """
+    if when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(filename, when=when, backupCount=backups)
+    elif max_bytes:
+        file_handler = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backups)
+    else:
+        file_handler = logging.FileHandler(filename)
+    file_handler.setFormatter(
+        JsonFormatter() if json_format else logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    )
+
+    queue_handler = DroppingQueueHandler(queue.Queue(queue_size))
+    queue_handler.addFilter(RateLimitFilter(burst, window))
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return queue_handler
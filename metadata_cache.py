@@ -0,0 +1,390 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+import aiosqlite
+
+# Only the fields the player needs are kept; full format lists are dropped
+CACHED_FIELDS = (
+    'id', 'extractor_key', 'title', 'url', 'webpage_url', 'duration', 'thumbnail', 'acodec', 'abr', 'asr'
+)
+DEFAULT_URL_TTL = 4 * 3600  # Used when a stream URL carries no expire parameter
+QUERY_TTL = 24 * 3600  # How long a search term keeps pointing at the same results
+METADATA_TTL = 7 * 24 * 3600  # How long video rows are kept in the database
+YOUTUBE_HOSTS = ('youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com')
+VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+def stream_url_expiry(url):
+    """Return the unix timestamp a googlevideo stream URL expires at, if known."""
+    try:
+        expire = parse_qs(urlparse(url).query).get('expire')
+        return int(expire[0]) if expire else None
+    except (TypeError, ValueError):
+        return None
+
+def video_id_from_url(query):
+    """Return the YouTube video id a URL points at, or None for playlists and searches."""
+    try:
+        parsed = urlparse(query.strip())
+    except (AttributeError, ValueError):
+        return None
+    host = (parsed.hostname or '').lower()
+    params = parse_qs(parsed.query)
+    if 'list' in params:
+        return None
+
+    video_id = None
+    if host == 'youtu.be':
+        video_id = parsed.path.lstrip('/').split('/')[0]
+    elif host in YOUTUBE_HOSTS:
+        if parsed.path == '/watch':
+            video_id = params.get('v', [None])[0]
+        elif parsed.path.startswith(('/shorts/', '/live/', '/embed/')):
+            video_id = parsed.path.split('/')[2]
+    if video_id and VIDEO_ID_RE.match(video_id):
+        return video_id
+    return None
+
+def video_key(data):
+    """Return the key a video is cached and counted under, or None if its site isn't known.
+
+    Ids are only unique per site (generic pages and radio streams use ids like
+    ``live`` or ``index``), so they are qualified with yt-dlp's extractor key.
+    """
+    video_id = data.get('id')
+    if not video_id:
+        return None
+    extractor = data.get('extractor_key') or data.get('ie_key')
+    if not extractor and video_id_from_url(data.get('webpage_url') or '') == video_id:
+        extractor = 'Youtube'
+    return f'{extractor}:{video_id}' if extractor else None
+
+def normalize_query(query):
+    """Build the cache key for a query: the video key when known, else the cleaned up text."""
+    video_id = video_id_from_url(query)
+    if video_id:
+        return f'id:Youtube:{video_id}'
+    query = ' '.join(query.split())
+    if query.startswith(('http://', 'https://')):
+        return f'url:{query}'
+    return f'q:{query.lower()}'
+
+def trim_info(info):
+    data = {field: info[field] for field in CACHED_FIELDS if info.get(field) is not None}
+    if info.get('_type') == 'url':
+        # Flat playlist entry: 'url' is the watch page, not a stream
+        data.pop('url', None)
+        data.setdefault('webpage_url', info.get('url'))
+        if 'extractor_key' not in data and info.get('ie_key'):
+            data['extractor_key'] = info['ie_key']
+        if 'thumbnail' not in data and info.get('thumbnails'):
+            data['thumbnail'] = info['thumbnails'][-1].get('url')
+    return data
+
+class MetadataCache:
+    """LRU/TTL cache of resolved yt-dlp metadata, persisted to SQLite.
+
+    Videos are cached by ``video_key`` together with their stream URL expiry.
+    Searches and playlists are cached by normalized query as a list of video keys, so the same
+    video resolved through different queries is only stored once. Concurrent
+    lookups for the same key share a single extraction.
+
+    Flat lookups (playlists read with ``extract_flat``) accept videos whose
+    stream URL is missing or expired; those come back without a ``url`` and are
+    resolved later, just before they are played.
+    """
+
+    def __init__(self, db_path, max_entries=5000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.videos = OrderedDict()
+        self.queries = OrderedDict()
+        self.loudness_table = OrderedDict()
+        self.inflight = {}
+        self.db = None
+        self._db_lock = asyncio.Lock()
+        self._pending = {}
+        self._flush_task = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def extract(self, query, fetch, min_ttl=0, flat=False):
+        """Return trimmed metadata for a query, calling ``fetch(query)`` only on a miss.
+
+        ``min_ttl`` is how many seconds the cached stream URLs must stay valid for.
+        """
+        key = normalize_query(query)
+        data = await self.lookup(key, min_ttl, flat)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        future = self.inflight.get((key, flat))
+        while future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The extraction we joined was cancelled with its guild; run our own
+                future = self.inflight.get((key, flat))
+
+        self.misses += 1
+        future = asyncio.get_event_loop().create_future()
+        self.inflight[(key, flat)] = future
+        try:
+            info = await fetch(query)
+            data = self.store(key, info)
+            future.set_result(data)
+            return data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Waiters re-raise it; don't log it as unretrieved
+            raise
+        finally:
+            self.inflight.pop((key, flat), None)
+
+    async def lookup(self, key, min_ttl=0, flat=False):
+        data = self._lookup_memory(key, min_ttl, flat)
+        if data is None and await self._load(key, min_ttl):
+            data = self._lookup_memory(key, min_ttl, flat)
+        return data
+
+    async def loudness(self, video_id):
+        """Return the stored loudnorm measurement for a video, if it was analysed before."""
+        if video_id in self.loudness_table:
+            self.loudness_table.move_to_end(video_id)
+            return self.loudness_table[video_id]
+        db = await self._connect()
+        if db is None:
+            return None
+        try:
+            async with db.execute('SELECT data FROM track_loudness WHERE id = ?', (video_id,)) as cursor:
+                row = await cursor.fetchone()
+        except Exception as e:
+            logging.error(f"Error loading loudness for {video_id}: {e}")
+            return None
+        if row is None:
+            return None
+        measurement = json.loads(row[0])
+        self._remember(self.loudness_table, video_id, measurement)
+        return measurement
+
+    def store_loudness(self, video_id, measurement):
+        self._remember(self.loudness_table, video_id, measurement)
+        self._queue_write(
+            'INSERT OR REPLACE INTO track_loudness (id, data) VALUES (?, ?)',
+            (video_id, json.dumps(measurement))
+        )
+
+    def store(self, key, info):
+        """Cache an extract_info result under its query key and return the trimmed copy."""
+        now = time.time()
+        if 'entries' in info:
+            entries = [trim_info(entry) for entry in info['entries'] if entry]
+            for entry in entries:
+                self._store_video(entry, now)
+            data = {'title': info.get('title'), 'entries': entries}
+            keys = [video_key(entry) for entry in entries]
+            if entries and all(keys):
+                query = {
+                    'title': info.get('title'),
+                    'ids': keys,
+                    'expires_at': now + QUERY_TTL,
+                }
+                self._remember(self.queries, key, query)
+                self._persist_query(key, query)
+            return data
+
+        data = trim_info(info)
+        self._store_video(data, now)
+        if video_key(data) and not key.startswith('id:'):
+            query = {'title': None, 'ids': None, 'video_id': video_key(data), 'expires_at': now + QUERY_TTL}
+            self._remember(self.queries, key, query)
+            self._persist_query(key, query)
+        return data
+
+    def _store_video(self, data, now):
+        key = video_key(data)
+        if key is None:
+            return
+        existing = self.videos.get(key)
+        if 'url' not in data and existing and 'url' in existing['data']:
+            # A flat entry must not wipe a stream URL we already resolved
+            existing['data'].update(data)
+            self.videos.move_to_end(key)
+            data, entry = existing['data'], existing
+        else:
+            expires_at = 0
+            if 'url' in data:
+                expires_at = stream_url_expiry(data['url']) or now + DEFAULT_URL_TTL
+            entry = {'data': data, 'fetched_at': now, 'expires_at': expires_at}
+        self._remember(self.videos, key, entry)
+        self._queue_write(
+            'INSERT OR REPLACE INTO metadata_videos (id, data, fetched_at, expires_at) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(data), entry['fetched_at'], entry['expires_at'])
+        )
+
+    def _persist_query(self, key, query):
+        self._queue_write(
+            'INSERT OR REPLACE INTO metadata_queries (query, data, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(query), query['expires_at'])
+        )
+
+    def _remember(self, table, key, value):
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > self.max_entries:
+            table.popitem(last=False)
+
+    def _valid_video(self, video_id, min_ttl, flat=False):
+        entry = self.videos.get(video_id)
+        if entry is None:
+            return None
+        self.videos.move_to_end(video_id)
+        if entry['expires_at'] - time.time() >= min_ttl:
+            return entry['data']
+        if flat:
+            return {field: value for field, value in entry['data'].items() if field != 'url'}
+        return None
+
+    def _lookup_memory(self, key, min_ttl, flat=False):
+        if key.startswith('id:'):
+            return self._valid_video(key[3:], min_ttl, flat)
+
+        query = self.queries.get(key)
+        if query is None:
+            return None
+        if query['expires_at'] < time.time():
+            del self.queries[key]
+            return None
+        self.queries.move_to_end(key)
+
+        if query.get('video_id'):
+            return self._valid_video(query['video_id'], min_ttl, flat)
+        entries = []
+        for video_id in query['ids']:
+            data = self._valid_video(video_id, min_ttl, flat)
+            if data is None:
+                return None
+            entries.append(data)
+        return {'title': query['title'], 'entries': entries}
+
+    async def _load(self, key, min_ttl=0):
+        """Pull a key and the videos it references from SQLite into memory.
+
+        Videos held in memory whose stream URL expires within ``min_ttl`` are
+        read again, since another process may have refreshed them.
+        """
+        db = await self._connect()
+        if db is None:
+            return False
+        try:
+            if key.startswith('id:'):
+                video_ids = [key[3:]]
+            else:
+                async with db.execute(
+                    'SELECT data, expires_at FROM metadata_queries WHERE query = ?', (key,)
+                ) as cursor:
+                    row = await cursor.fetchone()
+                if row is None or row[1] < time.time():
+                    return False
+                query = json.loads(row[0])
+                self._remember(self.queries, key, query)
+                video_ids = [query['video_id']] if query.get('video_id') else query['ids']
+
+            now = time.time()
+            missing = [
+                video_id for video_id in video_ids
+                if video_id not in self.videos or self.videos[video_id]['expires_at'] - now < min_ttl
+            ]
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                async with db.execute(
+                    f'SELECT id, data, fetched_at, expires_at FROM metadata_videos WHERE id IN ({placeholders})',
+                    chunk
+                ) as cursor:
+                    async for video_id, data, fetched_at, expires_at in cursor:
+                        if fetched_at < self.videos.get(video_id, {}).get('fetched_at', 0):
+                            continue  # Ours is newer and not written yet
+                        self._remember(self.videos, video_id, {
+                            'data': json.loads(data), 'fetched_at': fetched_at, 'expires_at': expires_at
+                        })
+            return True
+        except Exception as e:
+            logging.error(f"Error loading metadata cache entry {key}: {e}")
+            return False
+
+    async def _connect(self):
+        async with self._db_lock:
+            if self.db is None and self.db_path:
+                try:
+                    self.db = await aiosqlite.connect(self.db_path)
+                    # WAL lets every process of a cluster read the cache while another one writes
+                    await self.db.execute('PRAGMA journal_mode=WAL')
+                    await self.db.execute(
+                        'CREATE TABLE IF NOT EXISTS metadata_videos ('
+                        'id TEXT PRIMARY KEY, data TEXT NOT NULL, '
+                        'fetched_at REAL NOT NULL, expires_at REAL NOT NULL)'
+                    )
+                    await self.db.execute(
+                        'CREATE TABLE IF NOT EXISTS metadata_queries ('
+                        'query TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)'
+                    )
+                    await self.db.execute(
+                        'CREATE TABLE IF NOT EXISTS track_loudness (id TEXT PRIMARY KEY, data TEXT NOT NULL)'
+                    )
+                    # Rows from before ids were qualified with their extractor may belong to another site
+                    await self.db.execute("DELETE FROM metadata_videos WHERE id NOT LIKE '%:%'")
+                    await self.db.execute(
+                        "UPDATE OR IGNORE track_loudness SET id = 'Youtube:' || id "
+                        "WHERE id NOT LIKE '%:%' AND length(id) = 11"
+                    )
+                    await self.db.execute("DELETE FROM track_loudness WHERE id NOT LIKE '%:%'")
+                    now = time.time()
+                    await self.db.execute('DELETE FROM metadata_videos WHERE fetched_at < ?', (now - METADATA_TTL,))
+                    await self.db.execute('DELETE FROM metadata_queries WHERE expires_at < ?', (now,))
+                    await self.db.commit()
+                except Exception as e:
+                    logging.error(f"Failed to open metadata cache database: {e}")
+                    self.db_path = None
+                    self.db = None
+            return self.db
+
+    def _queue_write(self, sql, params):
+        """Buffer a row; everything queued in the same loop iteration is committed together."""
+        if not self.db_path:
+            return
+        self._pending.setdefault(sql, []).append(params)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        try:
+            db = await self._connect()
+            while self._pending and db is not None:
+                pending, self._pending = self._pending, {}
+                for sql, rows in pending.items():
+                    await db.executemany(sql, rows)
+                await db.commit()
+        except Exception as e:
+            logging.error(f"Error writing metadata cache: {e}")
+        finally:
+            self._flush_task = None
+
+    async def close(self):
+        if self._flush_task is not None:
+            await self._flush_task
+        if self.db is not None:
+            await self.db.close()
+            self.db = None
@@ -0,0 +1,162 @@
+import asyncio
+import bisect
+import logging
+import time
+
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return f'{{{pairs}}}'
+
+def _number(value):
+    return repr(float(value)) if value not in (float('inf'), float('-inf')) else ('+Inf' if value > 0 else '-Inf')
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self, kind='counter'):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {kind}']
+        for labels, value in self.values.items():
+            lines.append(f'{self.name}{_labels(self.labels, labels)} {_number(value)}')
+        return lines
+
+class Gauge(Counter):
+    """A value set directly, or read from ``collect`` (returning ``{labels: value}``) at scrape time.
+
+    With ``kind='counter'`` it exposes a running total kept by another object.
+    """
+
+    def __init__(self, name, documentation, labels=(), collect=None, kind='gauge'):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+        self.kind = kind
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def render(self):
+        if self.collect is not None:
+            self.values = self.collect()
+        return super().render(self.kind)
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            # Per-bucket counts; the cumulative counts are only summed up when scraped
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        names = self.labels + ('le',)
+        for labels, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(names, labels + (_number(bound),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+class BotMetrics:
+    """Hot-path timings and counters of the bot, rendered in Prometheus text format.
+
+    Recording only updates in-memory numbers on the event loop; nothing is sent
+    anywhere unless the endpoint is started and scraped.
+    """
+
+    def __init__(self):
+        self.extract_latency = Histogram(
+            'musicbot_extract_seconds', 'yt-dlp extraction latency, including time queued', ('kind',)
+        )
+        self.probe_latency = Histogram('musicbot_ffprobe_seconds', 'ffprobe run time for sources without a known codec')
+        self.spawn_latency = Histogram('musicbot_ffmpeg_spawn_seconds', 'Time to create an ffmpeg audio source')
+        self.first_audio = Histogram(
+            'musicbot_play_to_first_audio_seconds', 'Time from /play to the first audio packet',
+            buckets=(0.25, 0.5, 1, 2, 3, 5, 8, 13, 21, 34)
+        )
+        self.transition_gap = Histogram(
+            'musicbot_track_transition_seconds', 'Silence between the end of a track and the next one starting'
+        )
+        self.retries = Counter('musicbot_play_retries_total', 'Playback retries in play_next', ('path',))
+        self.cleanups = Counter('musicbot_voice_cleanups_total', 'Calls to cleanup_voice_client')
+        self.url_refreshes = Counter(
+            'musicbot_url_refreshes_total', 'Queued stream URLs re-resolved ahead of playback', ('result',)
+        )
+        self.loop_lag = Gauge('musicbot_event_loop_lag_seconds', 'How late the event loop ran a scheduled wakeup')
+        self.gauges = []
+
+    def gauge(self, name, documentation, collect, labels=()):
+        """Register a gauge read from ``collect`` when metrics are scraped."""
+        self.gauges.append(Gauge(name, documentation, labels, collect))
+
+    def counter(self, name, documentation, collect, labels=()):
+        """Register a counter whose totals are read from ``collect`` when metrics are scraped."""
+        self.gauges.append(Gauge(name, documentation, labels, collect, kind='counter'))
+
+    def render(self):
+        lines = []
+        for metric in (
+            self.extract_latency, self.probe_latency, self.spawn_latency, self.first_audio,
+            self.transition_gap, self.retries, self.cleanups, self.url_refreshes, self.loop_lag, *self.gauges
+        ):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logging.error(f"Failed to collect metric {metric.name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+    async def monitor_loop_lag(self, interval=1.0):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(interval)
+            self.loop_lag.set(max(0.0, time.monotonic() - started - interval))
+
+class MetricsServer:
+    """Serves ``/metrics`` on an aiohttp server in the bot's event loop."""
+
+    def __init__(self, metrics, host, port):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.runner = None
+        self.lag_task = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.lag_task = asyncio.create_task(self.metrics.monitor_loop_lag())
+        logging.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def handle(self, request):
+        return web.Response(text=self.metrics.render(), content_type='text/plain', charset='utf-8')
+
+    async def stop(self):
+        if self.lag_task:
+            self.lag_task.cancel()
+        if self.runner:
+            await self.runner.cleanup()
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import time
+
+import aiosqlite
+
+class PlayerJournal:
+    """Write-ahead journal of per-guild player state in SQLite.
+
+    Queue mutations are appended as journal rows and folded into a per-guild
+    snapshot once enough of them piled up. Player state (voice channel, current
+    song and position, loop mode, volume) is a single upserted row per guild.
+    All writes are buffered and committed in batches by a background task, so
+    the event loop never waits on the database.
+    """
+
+    def __init__(self, db_path, flush_interval=1.0, compact_after=500):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+        self.db = None
+        self.pending = []
+        self.journal_sizes = {}
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    @property
+    def enabled(self):
+        return bool(self.db_path)
+
+    async def open(self):
+        if not self.enabled:
+            return
+        self.db = await aiosqlite.connect(self.db_path)
+        await self.db.execute('PRAGMA journal_mode=WAL')
+        await self.db.execute(
+            'CREATE TABLE IF NOT EXISTS player_state ('
+            'guild_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)'
+        )
+        await self.db.execute(
+            'CREATE TABLE IF NOT EXISTS queue_snapshots ('
+            'guild_id INTEGER PRIMARY KEY, songs TEXT NOT NULL)'
+        )
+        await self.db.execute(
+            'CREATE TABLE IF NOT EXISTS queue_journal ('
+            'seq INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER NOT NULL, '
+            'op TEXT NOT NULL, data TEXT NOT NULL)'
+        )
+        await self.db.commit()
+        self._task = asyncio.create_task(self._run())
+
+    def log(self, guild_id, op, data):
+        """Record one queue mutation."""
+        if not self.enabled:
+            return
+        self.pending.append((
+            'INSERT INTO queue_journal (guild_id, op, data) VALUES (?, ?, ?)',
+            (guild_id, op, json.dumps(data))
+        ))
+        self.journal_sizes[guild_id] = self.journal_sizes.get(guild_id, 0) + 1
+
+    def needs_snapshot(self, guild_id):
+        return self.journal_sizes.get(guild_id, 0) >= self.compact_after
+
+    def snapshot(self, guild_id, songs):
+        """Replace a guild's journal with the full current queue."""
+        if not self.enabled:
+            return
+        self.pending.append((
+            'INSERT OR REPLACE INTO queue_snapshots (guild_id, songs) VALUES (?, ?)',
+            (guild_id, json.dumps(songs))
+        ))
+        self.pending.append(('DELETE FROM queue_journal WHERE guild_id = ?', (guild_id,)))
+        self.journal_sizes[guild_id] = 0
+
+    def save_state(self, guild_id, state):
+        if not self.enabled:
+            return
+        self.pending.append((
+            'INSERT OR REPLACE INTO player_state (guild_id, data, updated_at) VALUES (?, ?, ?)',
+            (guild_id, json.dumps(state), time.time())
+        ))
+
+    def forget(self, guild_id):
+        """Drop everything stored for a guild, e.g. after it was deliberately disconnected."""
+        if not self.enabled:
+            return
+        for table in ('player_state', 'queue_snapshots', 'queue_journal'):
+            self.pending.append((f'DELETE FROM {table} WHERE guild_id = ?', (guild_id,)))
+        self.journal_sizes.pop(guild_id, None)
+
+    async def load(self):
+        """Rebuild every saved guild as ``{guild_id: {'state': ..., 'queue': [...]}}``."""
+        if self.db is None:
+            return {}
+        guilds = {}
+        async with self.db.execute('SELECT guild_id, data FROM player_state') as cursor:
+            async for guild_id, data in cursor:
+                guilds[guild_id] = {'state': json.loads(data), 'queue': []}
+        async with self.db.execute('SELECT guild_id, songs FROM queue_snapshots') as cursor:
+            async for guild_id, songs in cursor:
+                guilds.setdefault(guild_id, {'state': None, 'queue': []})['queue'] = json.loads(songs)
+        async with self.db.execute('SELECT guild_id, op, data FROM queue_journal ORDER BY seq') as cursor:
+            async for guild_id, op, data in cursor:
+                saved = guilds.setdefault(guild_id, {'state': None, 'queue': []})
+                self._replay(saved['queue'], op, json.loads(data))
+        return guilds
+
+    @staticmethod
+    def _replay(songs, op, data):
+        def index_of(queue_id):
+            for index, song in enumerate(songs):
+                if song.get('queue_id') == queue_id:
+                    return index
+            return None
+
+        if op == 'add':
+            index = data.get('index')
+            songs.insert(len(songs) if index is None else index, data['song'])
+        elif op == 'add_many':
+            songs.extend(data['songs'])
+        elif op == 'next':
+            if songs:
+                songs.pop(0)
+        elif op == 'remove':
+            index = index_of(data['queue_id'])
+            if index is not None:
+                songs.pop(index)
+        elif op == 'move':
+            index = index_of(data['queue_id'])
+            if index is not None:
+                songs.insert(data['index'], songs.pop(index))
+        elif op == 'clear':
+            songs.clear()
+
+    async def flush(self):
+        """Commit everything buffered so far in one transaction."""
+        async with self._flush_lock:
+            if self.db is None or not self.pending:
+                return
+            pending, self.pending = self.pending, []
+            try:
+                # Consecutive statements with the same SQL go through one executemany
+                batch_sql, batch = None, []
+                for sql, params in pending:
+                    if sql != batch_sql and batch:
+                        await self.db.executemany(batch_sql, batch)
+                        batch = []
+                    batch_sql = sql
+                    batch.append(params)
+                if batch:
+                    await self.db.executemany(batch_sql, batch)
+                await self.db.commit()
+            except Exception as e:
+                logging.error(f"Error writing player journal: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        await self.flush()
+        if self.db is not None:
+            await self.db.close()
+            self.db = None
@@ -0,0 +1,146 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+class PlaylistError(Exception):
+    pass
+
+def track_url(entry):
+    """Return the page a yt-dlp entry is saved and later resolved from, or None if it has none."""
+    webpage_url = entry.get('webpage_url') or entry.get('original_url')
+    if not webpage_url and entry.get('id'):
+        webpage_url = f"https://www.youtube.com/watch?v={entry['id']}"
+    return webpage_url
+
+class PlaylistStore:
+    """Saved playlists in SQLite, one row per track with the metadata needed to queue it.
+
+    Tracks keep their video id, title, duration, thumbnail and page URL, so a
+    playlist can be queued without extracting anything; stream URLs are resolved
+    right before each track plays.
+    """
+
+    def __init__(self, db_path, max_tracks=1000, max_playlists=25):
+        self.db_path = db_path
+        self.max_tracks = max_tracks
+        self.max_playlists = max_playlists
+        self.db = None
+        self._write_lock = asyncio.Lock()
+
+    async def open(self):
+        self.db = await aiosqlite.connect(self.db_path)
+        await self.db.execute('PRAGMA journal_mode=WAL')
+        await self.db.execute('PRAGMA foreign_keys=ON')
+        await self.db.executescript(
+            'CREATE TABLE IF NOT EXISTS playlists ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER NOT NULL, name TEXT NOT NULL, '
+            'owner_id INTEGER NOT NULL, track_count INTEGER NOT NULL DEFAULT 0, '
+            'total_duration INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, '
+            'UNIQUE (guild_id, name));'
+            'CREATE TABLE IF NOT EXISTS playlist_tracks ('
+            'playlist_id INTEGER NOT NULL REFERENCES playlists (id) ON DELETE CASCADE, '
+            'position INTEGER NOT NULL, video_id TEXT, title TEXT, webpage_url TEXT NOT NULL, '
+            'duration INTEGER, thumbnail TEXT, PRIMARY KEY (playlist_id, position));'
+        )
+        await self.db.commit()
+
+    @asynccontextmanager
+    async def _transaction(self):
+        """Run a write in its own IMMEDIATE transaction, so counts read inside it stay valid.
+
+        Writes share one connection, so they also take turns within the process;
+        anything that fails is rolled back instead of being left in the next commit.
+        """
+        async with self._write_lock:
+            await self.db.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                await self.db.rollback()
+                raise
+            await self.db.commit()
+
+    async def create(self, guild_id, name, owner_id):
+        async with self._transaction():
+            async with self.db.execute('SELECT COUNT(*) FROM playlists WHERE guild_id = ?', (guild_id,)) as cursor:
+                (count,) = await cursor.fetchone()
+            if count >= self.max_playlists:
+                raise PlaylistError(f"This server already has {self.max_playlists} playlists")
+            try:
+                await self.db.execute(
+                    'INSERT INTO playlists (guild_id, name, owner_id, created_at) VALUES (?, ?, ?, ?)',
+                    (guild_id, name, owner_id, time.time())
+                )
+            except aiosqlite.IntegrityError:
+                raise PlaylistError(f"A playlist named {name} already exists")
+
+    async def get(self, guild_id, name):
+        """Return ``(id, owner_id, track_count, total_duration)`` for a playlist."""
+        async with self.db.execute(
+            'SELECT id, owner_id, track_count, total_duration FROM playlists WHERE guild_id = ? AND name = ?',
+            (guild_id, name)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            raise PlaylistError(f"No playlist named {name}")
+        return row
+
+    async def add_tracks(self, guild_id, name, entries):
+        """Append yt-dlp entries to a playlist in one transaction and return how many fit."""
+        async with self._transaction():
+            playlist_id, _, track_count, _ = await self.get(guild_id, name)
+            rows = []
+            for entry in entries[:max(0, self.max_tracks - track_count)]:
+                webpage_url = track_url(entry)
+                if not webpage_url:
+                    continue
+                rows.append((
+                    playlist_id, track_count + len(rows), entry.get('id'), entry.get('title', 'Unknown'),
+                    webpage_url, int(entry.get('duration') or 0), entry.get('thumbnail')
+                ))
+            if rows:
+                await self.db.executemany(
+                    'INSERT INTO playlist_tracks '
+                    '(playlist_id, position, video_id, title, webpage_url, duration, thumbnail) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', rows
+                )
+                await self.db.execute(
+                    'UPDATE playlists SET track_count = track_count + ?, total_duration = total_duration + ? '
+                    'WHERE id = ?',
+                    (len(rows), sum(row[5] for row in rows), playlist_id)
+                )
+        return len(rows)
+
+    async def tracks(self, playlist_id, offset, limit):
+        """Return one page of a playlist's tracks as yt-dlp style entries."""
+        async with self.db.execute(
+            'SELECT video_id, title, webpage_url, duration, thumbnail FROM playlist_tracks '
+            'WHERE playlist_id = ? AND position >= ? ORDER BY position LIMIT ?',
+            (playlist_id, offset, limit)
+        ) as cursor:
+            rows = await cursor.fetchall()
+        return [
+            {'id': video_id, 'title': title, 'webpage_url': webpage_url, 'duration': duration, 'thumbnail': thumbnail}
+            for video_id, title, webpage_url, duration, thumbnail in rows
+        ]
+
+    async def list(self, guild_id):
+        """Return ``(name, owner_id, track_count, total_duration)`` for every playlist of a guild."""
+        async with self.db.execute(
+            'SELECT name, owner_id, track_count, total_duration FROM playlists WHERE guild_id = ? ORDER BY name',
+            (guild_id,)
+        ) as cursor:
+            return await cursor.fetchall()
+
+    async def delete(self, guild_id, name):
+        async with self._transaction():
+            playlist_id = (await self.get(guild_id, name))[0]
+            await self.db.execute('DELETE FROM playlist_tracks WHERE playlist_id = ?', (playlist_id,))
+            await self.db.execute('DELETE FROM playlists WHERE id = ?', (playlist_id,))
+
+    async def close(self):
+        if self.db is not None:
+            await self.db.close()
+            self.db = None
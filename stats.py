@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+import aiosqlite
+
+EVENT_PLAY = 'play'
+EVENT_FINISH = 'finish'
+EVENT_SKIP = 'skip'
+
+GLOBAL_GUILD = 0  # Rollup rows keyed by this guild id hold totals across all guilds
+
+# Rollups are upserted by adding the buffered deltas to the stored totals
+_TRACK_UPSERT = (
+    'INSERT INTO track_totals (guild_id, video_id, title, plays, finishes, skips, listen_seconds) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (guild_id, video_id) DO UPDATE SET '
+    'title = excluded.title, plays = plays + excluded.plays, finishes = finishes + excluded.finishes, '
+    'skips = skips + excluded.skips, listen_seconds = listen_seconds + excluded.listen_seconds'
+)
+_USER_UPSERT = (
+    'INSERT INTO user_totals (guild_id, user_id, plays, skips, listen_seconds) VALUES (?, ?, ?, ?, ?) '
+    'ON CONFLICT (guild_id, user_id) DO UPDATE SET plays = plays + excluded.plays, '
+    'skips = skips + excluded.skips, listen_seconds = listen_seconds + excluded.listen_seconds'
+)
+_GUILD_UPSERT = (
+    'INSERT INTO guild_totals (guild_id, plays, skips, listen_seconds) VALUES (?, ?, ?, ?) '
+    'ON CONFLICT (guild_id) DO UPDATE SET plays = plays + excluded.plays, '
+    'skips = skips + excluded.skips, listen_seconds = listen_seconds + excluded.listen_seconds'
+)
+_HOUR_UPSERT = (
+    'INSERT INTO hourly_plays (guild_id, hour, plays) VALUES (?, ?, ?) '
+    'ON CONFLICT (guild_id, hour) DO UPDATE SET plays = plays + excluded.plays'
+)
+
+class StatsRecorder:
+    """Playback statistics with buffered ingestion and pre-aggregated rollups.
+
+    Events are appended to an in-memory buffer and folded into per-track,
+    per-user, per-guild and per-hour totals on every flush, in one transaction
+    with the raw event log. Leaderboards read the rollup tables through their
+    indexes, so they cost the same however much history was recorded, and
+    recording an event never touches the database.
+    """
+
+    def __init__(self, db_path, flush_interval=5.0, max_buffer=1000):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.db = None
+        self.events = []
+        self.started_at = time.time()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._task = None
+
+    @property
+    def enabled(self):
+        return bool(self.db_path)
+
+    async def open(self):
+        if not self.enabled:
+            return
+        self.db = await aiosqlite.connect(self.db_path)
+        await self.db.execute('PRAGMA journal_mode=WAL')
+        await self.db.executescript(
+            'CREATE TABLE IF NOT EXISTS play_events ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER NOT NULL, user_id INTEGER, '
+            'video_id TEXT, title TEXT, event TEXT NOT NULL, listen_seconds REAL NOT NULL, '
+            'created_at REAL NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS track_totals ('
+            'guild_id INTEGER NOT NULL, video_id TEXT NOT NULL, title TEXT, plays INTEGER NOT NULL, '
+            'finishes INTEGER NOT NULL, skips INTEGER NOT NULL, listen_seconds REAL NOT NULL, '
+            'PRIMARY KEY (guild_id, video_id));'
+            'CREATE INDEX IF NOT EXISTS track_totals_top ON track_totals (guild_id, plays DESC);'
+            'CREATE TABLE IF NOT EXISTS user_totals ('
+            'guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, plays INTEGER NOT NULL, '
+            'skips INTEGER NOT NULL, listen_seconds REAL NOT NULL, PRIMARY KEY (guild_id, user_id));'
+            'CREATE TABLE IF NOT EXISTS guild_totals ('
+            'guild_id INTEGER PRIMARY KEY, plays INTEGER NOT NULL, skips INTEGER NOT NULL, '
+            'listen_seconds REAL NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS hourly_plays ('
+            'guild_id INTEGER NOT NULL, hour INTEGER NOT NULL, plays INTEGER NOT NULL, '
+            'PRIMARY KEY (guild_id, hour));'
+        )
+        # Tracks are counted under extractor-qualified ids; fold in YouTube rows counted before that.
+        # Other bare ids can't be told apart and keep their own rows
+        await self.db.execute(
+            "UPDATE OR IGNORE track_totals SET video_id = 'Youtube:' || video_id "
+            "WHERE video_id NOT LIKE '%:%' AND length(video_id) = 11"
+        )
+        await self.db.commit()
+        self._task = asyncio.create_task(self._run())
+
+    def record(self, event, guild_id, song, listen_seconds=0.0):
+        """Buffer one play, finish or skip event for ``song``."""
+        if not self.enabled or not song.key:
+            return
+        self.events.append((
+            guild_id, song.requester_id, song.key, song.title,
+            event, max(0.0, listen_seconds), time.time()
+        ))
+        # A burst of events gets written early instead of growing the buffer without bound
+        if len(self.events) >= self.max_buffer and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """Write buffered events and their rollup deltas in one transaction."""
+        async with self._flush_lock:
+            if self.db is None or not self.events:
+                return
+            events, self.events = self.events, []
+            tracks, users, guilds, hours = {}, {}, {}, {}
+            for guild_id, user_id, video_id, title, event, seconds, created_at in events:
+                play = int(event == EVENT_PLAY)
+                finish = int(event == EVENT_FINISH)
+                skip = int(event == EVENT_SKIP)
+                for scope in (guild_id, GLOBAL_GUILD):
+                    track = tracks.setdefault((scope, video_id), [title, 0, 0, 0, 0.0])
+                    track[0] = title
+                    track[1] += play
+                    track[2] += finish
+                    track[3] += skip
+                    track[4] += seconds
+                    totals = guilds.setdefault(scope, [0, 0, 0.0])
+                    totals[0] += play
+                    totals[1] += skip
+                    totals[2] += seconds
+                    if play:
+                        hour = datetime.fromtimestamp(created_at).hour
+                        hours[(scope, hour)] = hours.get((scope, hour), 0) + 1
+                if user_id is not None:
+                    user = users.setdefault((guild_id, user_id), [0, 0, 0.0])
+                    user[0] += play
+                    user[1] += skip
+                    user[2] += seconds
+            try:
+                await self.db.executemany(
+                    'INSERT INTO play_events (guild_id, user_id, video_id, title, event, listen_seconds, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', events
+                )
+                await self.db.executemany(_TRACK_UPSERT, [(*key, *value) for key, value in tracks.items()])
+                await self.db.executemany(_USER_UPSERT, [(*key, *value) for key, value in users.items()])
+                await self.db.executemany(_GUILD_UPSERT, [(key, *value) for key, value in guilds.items()])
+                await self.db.executemany(_HOUR_UPSERT, [(*key, value) for key, value in hours.items()])
+                await self.db.commit()
+            except Exception as e:
+                logging.error(f"Error writing stats: {e}")
+                await self.db.rollback()
+
+    async def top_tracks(self, guild_id=GLOBAL_GUILD, limit=10):
+        return await self._fetch(
+            'SELECT video_id, title, plays, listen_seconds FROM track_totals '
+            'WHERE guild_id = ? ORDER BY plays DESC LIMIT ?', (guild_id, limit)
+        )
+
+    async def user_totals(self, guild_id, user_id):
+        rows = await self._fetch(
+            'SELECT plays, skips, listen_seconds FROM user_totals WHERE guild_id = ? AND user_id = ?',
+            (guild_id, user_id)
+        )
+        return rows[0] if rows else (0, 0, 0.0)
+
+    async def guild_totals(self, guild_id=GLOBAL_GUILD):
+        rows = await self._fetch(
+            'SELECT plays, skips, listen_seconds FROM guild_totals WHERE guild_id = ?', (guild_id,)
+        )
+        return rows[0] if rows else (0, 0, 0.0)
+
+    async def peak_hour(self, guild_id=GLOBAL_GUILD):
+        rows = await self._fetch(
+            'SELECT hour, plays FROM hourly_plays WHERE guild_id = ? ORDER BY plays DESC LIMIT 1', (guild_id,)
+        )
+        return rows[0] if rows else None
+
+    async def _fetch(self, sql, params):
+        if self.db is None:
+            return []
+        async with self.db.execute(sql, params) as cursor:
+            return await cursor.fetchall()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        await self.flush()
+        if self.db is not None:
+            await self.db.close()
+            self.db = None
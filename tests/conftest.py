@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Importing bot sets up its log file in the working directory; keep it out of the checkout
+os.chdir(tempfile.mkdtemp(prefix='musicbot-tests-'))
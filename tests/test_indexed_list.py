@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from indexed_list import IndexedList
+
+def check(items, expected):
+    assert len(items) == len(expected)
+    assert list(items) == expected
+    assert [items[i] for i in range(len(expected))] == expected
+
+def test_matches_list_under_random_operations():
+    rng = random.Random(3)
+    items, expected = IndexedList(), []
+    for step in range(3000):
+        op = rng.random()
+        if op < 0.3 or not expected:
+            index = rng.randint(0, len(expected))
+            items.insert(index, step)
+            expected.insert(index, step)
+        elif op < 0.4:
+            new = list(range(step * 10, step * 10 + rng.randint(0, 5)))
+            items.extend(new)
+            expected.extend(new)
+        elif op < 0.7:
+            index = rng.randrange(len(expected))
+            assert items.pop(index) == expected.pop(index)
+        elif op < 0.8:
+            index = rng.randrange(len(expected))
+            assert items[index] == expected[index]
+        else:
+            start = rng.randint(0, len(expected))
+            stop = rng.randint(start, len(expected) + 2)
+            assert list(items.slice(start, stop)) == expected[start:stop]
+    check(items, expected)
+
+def test_extend_keeps_order():
+    items = IndexedList(range(5))
+    items.extend(range(5, 100))
+    check(items, list(range(100)))
+    assert list(items.slice(90, 200)) == list(range(90, 100))
+
+def test_insert_clamps_index():
+    items = IndexedList([1, 2])
+    items.insert(-10, 0)
+    items.insert(100, 3)
+    check(items, [0, 1, 2, 3])
+
+def test_negative_index_and_bounds():
+    items = IndexedList('abc')
+    assert items[-1] == 'c'
+    assert items.pop() == 'c'
+    with pytest.raises(IndexError):
+        items[2]
+    with pytest.raises(IndexError):
+        IndexedList().pop()
@@ -0,0 +1,82 @@
+import asyncio
+import random
+
+from bot import MusicQueue, Song
+from player_state import PlayerJournal
+
+GUILD_ID = 1
+
+def song(n):
+    return Song({'id': f'id{n}', 'title': f'Song {n}', 'url': f'https://example.com/{n}', 'duration': n})
+
+def mutate(queue, rng, step):
+    op = rng.random()
+    if op < 0.3:
+        queue.add(song(step))
+    elif op < 0.4:
+        queue.add_many([song(step * 100 + i) for i in range(rng.randint(1, 4))])
+    elif op < 0.5:
+        queue.insert(rng.randint(0, len(queue)), song(step))
+    elif op < 0.6:
+        queue.next()
+    elif op < 0.8 and len(queue):
+        queue.remove(rng.randrange(len(queue)))
+    elif op < 0.9 and len(queue) > 1:
+        queue.move(rng.randrange(len(queue)), rng.randrange(len(queue)))
+    elif op < 0.93:
+        queue.shuffle()
+    elif op < 0.96:
+        queue.requeue_history()
+    elif op < 0.97:
+        queue.clear()
+
+async def replay(db_path, seed, steps, compact_after):
+    rng = random.Random(seed)
+    journal = PlayerJournal(db_path, flush_interval=3600, compact_after=compact_after)
+    await journal.open()
+    queue = MusicQueue(GUILD_ID, journal, capacity=200)
+    for step in range(steps):
+        mutate(queue, rng, step)
+        if rng.random() < 0.1:
+            await journal.flush()
+    await journal.close()
+
+    reopened = PlayerJournal(db_path)
+    await reopened.open()
+    saved = await reopened.load()
+    await reopened.close()
+    return [s.to_dict() for s in queue], saved.get(GUILD_ID, {'queue': []})['queue']
+
+def test_journal_replays_to_the_live_queue(tmp_path):
+    for seed, compact_after in ((7, 500), (11, 5), (13, 1)):
+        live, restored = asyncio.run(replay(str(tmp_path / f'{seed}.db'), seed, 800, compact_after))
+        assert restored == live
+
+def test_remove_is_not_undone_by_a_snapshot(tmp_path):
+    async def run():
+        journal = PlayerJournal(str(tmp_path / 'remove.db'), compact_after=3)
+        await journal.open()
+        queue = MusicQueue(GUILD_ID, journal)
+        queue.add(song(1))
+        queue.add(song(2))
+        # The third journal entry triggers a snapshot
+        queue.remove(0)
+        await journal.close()
+        reopened = PlayerJournal(journal.db_path)
+        await reopened.open()
+        saved = await reopened.load()
+        await reopened.close()
+        return [s['id'] for s in saved[GUILD_ID]['queue']]
+
+    assert asyncio.run(run()) == ['id2']
+
+def test_running_size_matches_the_songs():
+    rng = random.Random(5)
+    queue = MusicQueue(GUILD_ID, capacity=200)
+    for step in range(2000):
+        mutate(queue, rng, step)
+        song = next(iter(queue), None)
+        if song is not None and rng.random() < 0.05:
+            song.url += '&refreshed=1'
+    assert queue.song_bytes == sum(s.counted_size for s in queue)
+    assert queue.history_bytes == sum(s.counted_size for s in queue.history)
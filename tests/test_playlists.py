@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from playlists import PlaylistError, PlaylistStore
+
+def entries(count, prefix):
+    return [{'id': f'{prefix}{i}', 'title': f'{prefix} {i}', 'webpage_url': f'https://example.com/{prefix}{i}'}
+            for i in range(count)]
+
+async def open_store(tmp_path, max_tracks=1000):
+    store = PlaylistStore(str(tmp_path / 'playlists.db'), max_tracks=max_tracks)
+    await store.open()
+    await store.create(1, 'mix', 10)
+    return store
+
+def test_concurrent_adds_get_their_own_positions(tmp_path):
+    async def run():
+        store = await open_store(tmp_path)
+        added = await asyncio.gather(
+            store.add_tracks(1, 'mix', entries(200, 'a')),
+            store.add_tracks(1, 'mix', entries(1, 'b')),
+        )
+        playlist_id, _, track_count, _ = await store.get(1, 'mix')
+        tracks = await store.tracks(playlist_id, 0, 1000)
+        await store.close()
+        return added, track_count, tracks
+
+    added, track_count, tracks = asyncio.run(run())
+    assert added == [200, 1]
+    assert track_count == len(tracks) == 201
+
+def test_limit_applies_across_concurrent_adds(tmp_path):
+    async def run():
+        store = await open_store(tmp_path, max_tracks=5)
+        added = await asyncio.gather(*(store.add_tracks(1, 'mix', entries(2, str(n))) for n in range(4)))
+        await store.close()
+        return added
+
+    assert sorted(asyncio.run(run())) == [0, 1, 2, 2]
+
+def test_failed_write_is_rolled_back(tmp_path):
+    async def run():
+        store = await open_store(tmp_path)
+        with pytest.raises(PlaylistError):
+            await store.add_tracks(1, 'missing', entries(1, 'a'))
+        with pytest.raises(PlaylistError):
+            await store.create(1, 'mix', 10)
+        await store.add_tracks(1, 'mix', entries(3, 'a'))
+        names = [row[0] for row in await store.list(1)]
+        track_count = (await store.get(1, 'mix'))[2]
+        await store.close()
+        return names, track_count
+
+    assert asyncio.run(run()) == (['mix'], 3)
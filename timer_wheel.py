@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import math
+import time
+
+class TimerWheel:
+    """One deadline per key on a hashed timer wheel, driven by a single task.
+
+    Setting a key's timer only overwrites its deadline and drops the key into
+    the slot it expires in. Superseded entries are skipped when their slot
+    comes round, so neither resets nor cancels have to search the wheel. Each
+    tick the wheel looks at one slot and calls ``on_expire(key, tag)`` for the
+    keys due in it, whatever the number of timers.
+    """
+
+    def __init__(self, on_expire, tick=1.0, slots=512):
+        self.on_expire = on_expire
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.deadlines = {}  # key -> (tick it expires on, tag)
+        self.current = 0
+        self.started = time.monotonic()
+        self.fired = 0
+        self.task = None
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def start(self):
+        self.started = time.monotonic()
+        self.current = 0
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def reset(self, key, timeout, tag=None):
+        """(Re)start the timer of ``key``, replacing any deadline it had."""
+        due = self._now() + max(1, math.ceil(timeout / self.tick))
+        self.deadlines[key] = (due, tag)
+        self.slots[due % len(self.slots)].add(key)
+
+    def cancel(self, key):
+        self.deadlines.pop(key, None)
+
+    def tag(self, key):
+        """Return the tag the running timer of ``key`` was set with, or None."""
+        entry = self.deadlines.get(key)
+        return entry[1] if entry else None
+
+    def _now(self):
+        return int((time.monotonic() - self.started) / self.tick)
+
+    def _advance(self, tick):
+        index = tick % len(self.slots)
+        slot = self.slots[index]
+        for key in list(slot):
+            entry = self.deadlines.get(key)
+            if entry is None or entry[0] % len(self.slots) != index:
+                slot.discard(key)  # Cancelled or moved to another slot
+            elif entry[0] <= tick:
+                slot.discard(key)
+                del self.deadlines[key]
+                self.fired += 1
+                asyncio.create_task(self._expire(key, entry[1]))
+            # Otherwise the deadline is a later turn of the wheel
+
+    async def _expire(self, key, tag):
+        try:
+            await self.on_expire(key, tag)
+        except Exception as e:
+            logging.error(f"Error in timer callback for {key}: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            # Catch up on every slot passed, even when the event loop ran late
+            now = self._now()
+            while self.current < now:
+                self.current += 1
+                self._advance(self.current)